@@ -0,0 +1,195 @@
+# benchmarks for the interpreter. every workload goes through the whole thing (building the grammar, parsing, checking,
+# running) with every phase timed on its own, the best of --repeat runs gets kept.
+# how much memory each one needed is in there too, it doesn't get compared against the baseline though.
+# usage: python3 benchmarks/bench.py [--output results.json] [--baseline benchmarks/baseline.json] [--save-baseline]
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+import litthewlang
+
+# in the order they happen, compile only happens with the compiled and python engines
+PHASES = ["grammar", "parse", "transform", "scope", "typecheck", "optimize", "compile", "execute"]
+
+def readWorkload(name):
+    with open(os.path.join(BENCHMARK_DIR, name), 'r') as f:
+        return f.read()
+
+# a really big (but boring) file for the parser, lots of functions, globals and calls
+def generateParserStress(count):
+    lines = ['c("generated, this one is here for the parser"m)']
+    for i in range(count):
+        lines.append(f"defo stress{i}(m num a, m num b, m str s)")
+        lines.append(f"    m num t = add(mul(a, {i}m), sub(b, 1m))")
+        lines.append("    m str u = concat(s, numtostr(t))")
+        lines.append(f"    m num returno = lazyif(gt(t, {i * 3}m), t, div(t, 2m))")
+        lines.append("fino")
+        lines.append("")
+        lines.append(f"m num global{i} = stress{i}({i}m, add({i}m, 2m), \"x\"m)")
+        lines.append(f"global{i} = add(global{i}, 1m)")
+    lines.append(f"print(numtostr(global{count - 1}))")
+    return "\n".join(lines) + "\n"
+
+# name -> (makes the source, options for CompiledProgram.run)
+workloads = {
+    # without memoizing fib would be too fast to tell anything
+    "recursion": (lambda: readWorkload("recursion.litthew"), {"memo_size": None}),
+    "list_large": (lambda: readWorkload("list_large.litthew"), {}),
+    "strings": (lambda: readWorkload("strings.litthew"), {}),
+    "heap": (lambda: readWorkload("heap.litthew"), {}),
+    # about 32000 lines, parsing it takes minutes
+    "parser_stress": (lambda: generateParserStress(4000), {}),
+}
+
+# workloads too big to run more than once, they don't get a memory run either (tracing makes them take forever)
+RUN_ONCE = {"parser_stress"}
+
+def runWorkload(source, run_options, engine):
+    timings = {}
+    # a new Interpreter every time so the grammar gets built every time
+    interpreter = litthewlang.Interpreter()
+    compiled_program = interpreter.compile(source, timings)
+    if (len(compiled_program.errors) != 0):
+        raise Exception("the benchmark doesn't even type check:\n" + compiled_program.errors[0])
+    compiled_program.run(engine=engine, timings=timings, **run_options)
+    return timings
+
+# memory gets its own run, tracing every allocation makes everything a lot slower so it can't happen while timing.
+# peak is the most that was in use at once from parsing to the end of the run (the grammar is built before it starts
+# counting) and program is how much the checked program takes up once it's compiled
+def measureMemory(source, run_options, engine):
+    interpreter = litthewlang.Interpreter()
+    interpreter.buildParser()
+    tracemalloc.start()
+    try:
+        compiled_program = interpreter.compile(source)
+        # whatever parsing left lying around in cycles would count as part of the program otherwise
+        gc.collect()
+        program_bytes = tracemalloc.get_traced_memory()[0]
+        compiled_program.run(engine=engine, **run_options)
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"peak_bytes": peak_bytes, "program_bytes": program_bytes}
+
+def runBenchmarks(names, repeat, engine):
+    results = {}
+    memory = {}
+    for name in names:
+        make_source, run_options = workloads[name]
+        source = make_source()
+        best = {}
+        for _ in range(1 if name in RUN_ONCE else repeat):
+            for phase, seconds in runWorkload(source, run_options, engine).items():
+                best[phase] = min(best.get(phase, seconds), seconds)
+        results[name] = {phase: best[phase] for phase in PHASES if phase in best.keys()}
+        line = f"{name:>14} " + " ".join(f"{phase} {seconds * 1000:.1f}ms" for phase, seconds in results[name].items())
+        if name not in RUN_ONCE:
+            memory[name] = measureMemory(source, run_options, engine)
+            line += f" peak {memory[name]['peak_bytes'] / 1048576:.1f}MiB program {memory[name]['program_bytes'] / 1024:.0f}KiB"
+        print(line, file=sys.stderr)
+    return results, memory
+
+# every phase that got slower than the baseline by more than threshold (a fraction) and min_time (seconds, so the phases
+# that take no time at all don't fail on noise)
+def findRegressions(results, baseline, threshold, min_time):
+    regressions = []
+    for name, phases in results.items():
+        for phase, seconds in phases.items():
+            before = baseline.get(name, {}).get(phase)
+            if before is None:
+                continue
+            if seconds > before * (1 + threshold) and seconds - before > min_time:
+                regressions.append(f"{name} {phase}: {before * 1000:.1f}ms -> {seconds * 1000:.1f}ms (+{(seconds / before - 1) * 100 if before > 0 else float('inf'):.0f}%)")
+    return regressions
+
+# timings are only worth comparing on the same kind of computer with the same python. the hostname changes every run on
+# ci, so by default it's what the computer is, and ci can name its runners itself with --machine
+def machineName():
+    return os.environ.get("LITTHEW_BENCH_MACHINE") or f"{platform.system()} {platform.machine()} {os.cpu_count()} cpus"
+
+# there's a baseline but it can't be used, that's only a failure with --require-baseline
+def cantCompare(message, required):
+    print(f"{message}, nothing to compare against (--save-baseline makes one)", file=sys.stderr)
+    return 2 if required else 0
+
+def main():
+    argument_parser = argparse.ArgumentParser(description='Time every phase of the interpreter on a few workloads.')
+    argument_parser.add_argument('workloads', nargs='*',
+                        help=f'which workloads to run, out of {", ".join(workloads.keys())} (default: all of them)')
+    argument_parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='run every workload this many times and keep the fastest of each phase (default: 3)')
+    argument_parser.add_argument('-e', '--engine', choices=['tree', 'compiled', 'python'], default='tree',
+                        help='which engine runs the programs (default: tree)')
+    argument_parser.add_argument('-o', '--output',
+                        help='write the results as json here (default: stdout)')
+    argument_parser.add_argument('--baseline', default=os.path.join(BENCHMARK_DIR, 'baseline.json'),
+                        help='results to compare against (default: benchmarks/baseline.json)')
+    argument_parser.add_argument('--save-baseline', action='store_true',
+                        help='write the results to --baseline instead of comparing against it')
+    argument_parser.add_argument('--require-baseline', action='store_true',
+                        help="fail (exit 2) when there's no baseline or it was made on another machine, python or engine, for ci")
+    argument_parser.add_argument('--machine', default=machineName(),
+                        help='what the baseline was made on has to be called the same to compare against it (default: $LITTHEW_BENCH_MACHINE or the os, cpu and number of cpus)')
+    argument_parser.add_argument('--threshold', type=float, default=0.25,
+                        help='how much slower (as a fraction) a phase can get before it counts as a regression (default: 0.25)')
+    argument_parser.add_argument('--min-time', type=float, default=0.005,
+                        help="a phase has to be at least this many seconds slower to count, so tiny phases don't fail on noise (default: 0.005)")
+    arguments = argument_parser.parse_args()
+
+    names = arguments.workloads if len(arguments.workloads) != 0 else list(workloads.keys())
+    for name in names:
+        if name not in workloads.keys():
+            argument_parser.error(f"there's no workload called {name}")
+    start = time.perf_counter()
+    timings, memory = runBenchmarks(names, arguments.repeat, arguments.engine)
+    results = {
+        "engine": arguments.engine,
+        "machine": arguments.machine,
+        "python": platform.python_version(),
+        "workloads": timings,
+        "memory": memory,
+    }
+    print(f"benchmarks took {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+    text = json.dumps(results, indent=4) + "\n"
+    if (arguments.output is not None):
+        with open(arguments.output, 'w') as f:
+            f.write(text)
+    elif (not arguments.save_baseline):
+        sys.stdout.write(text)
+
+    if (arguments.save_baseline):
+        with open(arguments.baseline, 'w') as f:
+            f.write(text)
+        print(f"saved the baseline to {arguments.baseline}", file=sys.stderr)
+        return 0
+
+    if (not os.path.exists(arguments.baseline)):
+        return cantCompare(f"no baseline at {arguments.baseline}", arguments.require_baseline)
+    with open(arguments.baseline, 'r') as f:
+        baseline = json.load(f)
+    if (baseline.get("engine") != arguments.engine):
+        return cantCompare(f"the baseline was for the {baseline.get('engine')} engine, not {arguments.engine}", arguments.require_baseline)
+    if (baseline.get("machine") != results["machine"] or baseline.get("python") != results["python"]):
+        return cantCompare(f"the baseline was made on {baseline.get('machine')} with python {baseline.get('python')}, not {results['machine']} with python {results['python']}", arguments.require_baseline)
+
+    regressions = findRegressions(results["workloads"], baseline["workloads"], arguments.threshold, arguments.min_time)
+    for regression in regressions:
+        print(f"regression: {regression}", file=sys.stderr)
+    if (len(regressions) != 0):
+        print(f"{len(regressions)} phase(s) got more than {arguments.threshold * 100:.0f}% slower. Shame.", file=sys.stderr)
+        return 1
+    print("no regressions", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    exit(main())
@@ -2,12 +2,113 @@ from typing import Any
 import lark
 from enum import Enum
 
-from typeguard import typechecked
-
 import sys
 
 import argparse
 
+import csv
+import hashlib
+import importlib.util
+import io
+import json
+import mmap
+import os
+import pickle
+import threading
+import multiprocessing
+import time
+import traceback
+
+from array import array
+import math
+
+# numpy only gets imported the first time a bulk heap function wants it (importing it takes longer than most programs
+# run) and everything it speeds up has a plain python version for when it isn't installed
+numpy_module = None
+
+def loadNumpy():
+    global numpy_module
+    if numpy_module is None:
+        try:
+            import numpy
+            numpy_module = numpy
+        except ImportError:
+            numpy_module = False
+    return numpy_module or None
+
+VERSION = "v0.2.0"
+
+# where the cache goes unless --cache-dir says somewhere else, the user's own cache folder ($XDG_CACHE_HOME or ~/.cache)
+def defaultCacheDir():
+    return os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "litthewlang")
+
+argument_parser = argparse.ArgumentParser(
+                    prog='Litthew Interpreter',
+                    description='This will interpret your Litthewlang programs.',
+                    epilog=f'This is version {VERSION}')
+
+argument_parser.add_argument('filename', nargs='?', help='the Litthewlang file to be interpreted')
+argument_parser.add_argument('-t', '--no-type',
+                    action='store_true', help='disable type checking')  # on/off flag
+argument_parser.add_argument('-g', '--no-gender',
+                    action='store_true', help='disable gender type checking')
+argument_parser.add_argument('-e', '--engine', choices=['tree', 'compiled', 'python'], default='tree',
+                    help='pick how the program gets executed: walk the tree (default), compile it into closures first or turn it into a python module (cached like the program)')
+argument_parser.add_argument('--no-cache',
+                    action='store_true', help="don't read or write the compiled program cache")
+argument_parser.add_argument('--clear-cache',
+                    action='store_true', help='delete everything in the compiled program cache before running')
+argument_parser.add_argument('--cache-dir', default=defaultCacheDir(),
+                    help='where compiled programs get cached (default: litthewlang in $XDG_CACHE_HOME or ~/.cache)')
+argument_parser.add_argument('--no-fold',
+                    action='store_true', help="don't fold constant calls or drop dead code before running")
+argument_parser.add_argument('--inline-size', type=int, default=20,
+                    help='inline calls to functions that are not recursive and have at most this many nodes in their body, 0 turns it off (default: 20)')
+argument_parser.add_argument('--lazy-args',
+                    action='store_true', help="pass args that call your own functions to params that don't always get read without working them out first, they only get worked out if they get used")
+argument_parser.add_argument('--no-memo',
+                    action='store_true', help="don't remember what pure functions gave back")
+argument_parser.add_argument('--memo-size', type=int, default=1024,
+                    help='how many results each pure function remembers (default: 1024)')
+argument_parser.add_argument('--memo-stats',
+                    action='store_true', help='print how often each pure function got its result from memory when the program is done')
+argument_parser.add_argument('--buffering', choices=['auto', 'line', 'block'], default='auto',
+                    help="when print's output gets written: every line (line), in big chunks (block) or line for terminals and block for pipes and files (auto, the default)")
+argument_parser.add_argument('--profile',
+                    action='store_true', help='time every function and builtin and count heap reads/writes, the report goes to stderr when the program is done')
+argument_parser.add_argument('--profile-stacks', metavar='PATH',
+                    help='with --profile, also write collapsed stacks (for flamegraph tools) to this file')
+argument_parser.add_argument('--batch', nargs='+', metavar='PATH',
+                    help='run every .litthew file in these files/folders instead of filename, one after the other in the output')
+argument_parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                    help='how many worker processes --batch and parmapnum use (default: one per cpu)')
+argument_parser.add_argument('-w', '--watch',
+                    action='store_true', help='keep checking filename every time it changes, only re-checking the statements that did (never runs it)')
+argument_parser.add_argument('--max-errors', type=int, default=0,
+                    help='only show this many errors (and how many more there were), 0 shows all of them (the default)')
+argument_parser.add_argument('--error-format', choices=['text', 'json'], default='text',
+                    help='print the errors to stderr as text (default) or as one json object per line')
+argument_parser.add_argument('--debug',
+                    action='store_true', help="have typeguard check the interpreter's own types at runtime (slow, needs typeguard)")
+# argument_parser.add_argument('-n', '--no-name',
+#                     action='store_true')
+
+DO_SEMANTIC_NAME_CHECK = False
+
+# typeguard checks every call at runtime, which is great for catching interpreter bugs and terrible for speed,
+# so these classes only get remembered here and instrumented by enableDebugChecks in debug mode (and typeguard only
+# has to be installed for it)
+debug_checked_classes = []
+
+def typechecked(cls):
+    debug_checked_classes.append(cls)
+    return cls
+
+def enableDebugChecks():
+    from typeguard import typechecked as instrument
+    for cls in debug_checked_classes:
+        instrument(cls)
+
 
 class PrimitiveType(Enum):
     NUM = 1
@@ -18,12 +119,29 @@ class GenderType(Enum):
     MALE = 1
     FEMALE = 2
 
-@typechecked 
+# the bits of GeneralType.bits, see below
+PRIMITIVE_TYPE_BITS = 0b0011
+ALWAYS_EQUAL_BIT = 0b10000
+
+# types are interned, asking for the same type twice gives back the same object. that means nothing allocates types while
+# checking or running and comparing two types is an identity check (or a bit compare, see matches)
+@typechecked
 class GeneralType():
-    def __init__(self, primitive_type: PrimitiveType, gender_type: GenderType, always_equal = False):
+    __slots__ = ('primitive_type', 'gender_type', 'always_equal', 'bits')
+    interned_types = {}
+
+    def __new__(cls, primitive_type: PrimitiveType, gender_type: GenderType, always_equal = False):
+        key = (primitive_type, gender_type, always_equal)
+        if key in cls.interned_types:
+            return cls.interned_types[key]
+        self = super().__new__(cls)
         self.primitive_type = primitive_type
         self.gender_type = gender_type
         self.always_equal = always_equal
+        # primitive type in the low two bits, gender in the next two, then always_equal
+        self.bits = primitive_type.value | (gender_type.value << 2) | (ALWAYS_EQUAL_BIT if always_equal else 0)
+        cls.interned_types[key] = self
+        return self
     
     def get_primitive_type(self) -> PrimitiveType:
         return self.primitive_type
@@ -49,78 +167,563 @@ class GeneralType():
         return f"{self.primitive_type} {self.gender_type}"
     
     def __eq__(self, other):
-        return self.always_equal or other.always_equal or (self.primitive_type == other.primitive_type and (self.gender_type == other.gender_type or not DO_GENDER_CHECK))
-
-
-
-argument_parser = argparse.ArgumentParser(
-                    prog='Litthew Interpreter',
-                    description='This will interpret your Litthewlang programs.',
-                    epilog='This is version v0.2.0')
-
-argument_parser.add_argument('filename',  help='the Litthewlang file to be interpreted')
-argument_parser.add_argument('-t', '--no-type',
-                    action='store_true', help='disable type checking')  # on/off flag
-argument_parser.add_argument('-g', '--no-gender',
-                    action='store_true', help='disable gender type checking') 
-# argument_parser.add_argument('-n', '--no-name',
-#                     action='store_true')
-
-arguments = argument_parser.parse_args()
-
-DO_SEMANTIC_NAME_CHECK = False
-DO_TYPE_CHECK = not arguments.no_type
-DO_GENDER_CHECK = not arguments.no_gender
-
-with open('litthewlang.lark', 'r') as f:
-    content = f.read()
+        return self is other or (self.bits | other.bits) & ALWAYS_EQUAL_BIT != 0 or self.bits == other.bits
 
-parser = lark.Lark(content, propagate_positions=True)
+    # what the type checker uses, without the gender check an m num is fine where an f num is wanted
+    def matches(self, other, gender_check) -> bool:
+        if self == other:
+            return True
+        if gender_check:
+            return False
+        return (self.bits ^ other.bits) & PRIMITIVE_TYPE_BITS == 0
 
+    # unpickling (the program cache) has to go through __new__ so it gets the interned type back
+    def __reduce__(self):
+        return (GeneralType, (self.primitive_type, self.gender_type, self.always_equal))
 
-programName = arguments.filename
 
-# basically this contains a dict of all global variable names and their values
-variable_dict_globals = {
-    "falso": False,
-    "truo": True,
-    "falsa": False,
-    "trua": True
-}
-
-# same thing as above but stacking for function scope
-variable_dict_stack = [{}]
 
-# this is a dict of all the global variable types
-variable_dict_globals_types = {
-    "falso": GeneralType(PrimitiveType.BOOL, GenderType.MALE),
-    "truo": GeneralType(PrimitiveType.BOOL, GenderType.MALE),
-    "falsa": GeneralType(PrimitiveType.BOOL, GenderType.FEMALE),
-    "trua": GeneralType(PrimitiveType.BOOL, GenderType.FEMALE)
-}
-
-# these are some lists that include all of certain created types to run type checking and stuff on them in a correct order
-typechecks = []
+GRAMMAR_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'litthewlang.lark')
 
+# the builtin functions, these get filled in once when this file is loaded and never change after that.
+# everything a program adds (its own functions, its globals, its errors) lives on its Program, and everything that changes
+# while it runs (globals, frames, heaps) lives on a Runtime
 functions_dict_globals = {}
 
+# builtins that only look at their arguments (no printing, no heaps), calling them twice with the same stuff gives the same answer
+functions_pure_builtins = set()
+
 # includes tuples of (name, [param, param, param, return type])
 functions_dict_globals_types = {}
 functions_dict_globals_types_params = {}
 
-string_heap = {}
-num_heap = {}
-bool_heap = {}
+# what concat gives back once strings get long. it only remembers the two strings that went into it, so building a
+# string out of a lot of concats doesn't copy everything that's already there every time. the actual string only gets made
+# (once, then it's kept) when something looks at it: print, eqstr, the heaps, numtostr and friends.
+# it acts enough like a str (==, <, hash, len, str(), + ...) that -t programs that hand it to anything else still work
+class Rope():
+    __slots__ = ('left', 'right', 'length', 'text')
+
+    def __init__(self, left, right):
+        self.left = left
+        self.right = right
+        self.length = len(left) + len(right)
+        self.text = None
+
+    def flatten(self) -> str:
+        if self.text is None:
+            # no recursion, a string built in a loop is a rope as deep as the loop was long
+            pieces = []
+            waiting = [self]
+            while len(waiting) != 0:
+                node = waiting.pop()
+                if type(node) is str:
+                    pieces.append(node)
+                elif node.text is not None:
+                    pieces.append(node.text)
+                else:
+                    waiting.append(node.right)
+                    waiting.append(node.left)
+            self.text = "".join(pieces)
+            # the pieces aren't needed anymore, whatever else uses them still has them
+            self.left = None
+            self.right = None
+        return self.text
+
+    def __str__(self):
+        return self.flatten()
 
-published_errors = []
+    def __repr__(self):
+        return repr(self.flatten())
+
+    def __len__(self):
+        return self.length
 
-with open(programName, 'r') as f:
-    content = f.read()
+    def __bool__(self):
+        return self.length != 0
 
-def parse(text):
-    return parser.parse(text)
+    def __hash__(self):
+        return hash(self.flatten())
+
+    def __eq__(self, other):
+        if type(other) is not str and type(other) is not Rope:
+            # a str is never equal to anything else, no point flattening to find that out (the memos ask a lot)
+            return NotImplemented
+        return self.flatten() == materialize(other)
+
+    def __lt__(self, other):
+        return self.flatten() < materialize(other)
+
+    def __gt__(self, other):
+        return self.flatten() > materialize(other)
+
+    def __add__(self, other):
+        return self.flatten() + materialize(other)
+
+    def __radd__(self, other):
+        return other + self.flatten()
+
+# strings shorter than this just get added together, copying them is cheaper than making a Rope
+ROPE_MIN_LENGTH = 256
+
+def concatStrings(a, b):
+    if type(a) is str and type(b) is str and len(a) + len(b) < ROPE_MIN_LENGTH:
+        return a + b
+    if isinstance(a, (str, Rope)) and isinstance(b, (str, Rope)):
+        return Rope(a, b)
+    # only with -t, whatever + does
+    return a + b
+
+def materialize(value):
+    if type(value) is Rope:
+        return value.flatten()
+    return value
+
+# the heaps are what addnum/getnum and friends read and write. keys are nums, but lists only ever use small whole
+# numbers, so those live in a flat array (index i is key i) and only weird keys (negative, fractional, way past the end)
+# go in a dict like they all used to. mapnum adds a third place: whole files mapped in as they are (see NumHeap.mapFile),
+# every key lives in exactly one of the three
+class Heap():
+    # keys up to this far past the end of the array grow it, anything further goes in the dict
+    MAX_DENSE_GAP = 1 << 16
+
+    def __init__(self, values, value_type):
+        self.values = values
+        self.present = bytearray()
+        self.value_type = value_type
+        self.sparse = {}
+        # (low, high, view) for every mapped file, keys low to high - 1 are view[0] to view[high - low - 1]
+        self.mapped = []
+
+    def load(self, key):
+        try:
+            index = int(key)
+        except (TypeError, ValueError, OverflowError):
+            return self.sparse[key]
+        if index == key and 0 <= index < len(self.present) and self.present[index]:
+            return self.values[index]
+        if self.mapped and index == key:
+            for low, high, view in self.mapped:
+                if low <= index < high:
+                    return view[index - low]
+        return self.sparse[key]
+
+    def store(self, key, value):
+        try:
+            index = int(key)
+        except (TypeError, ValueError, OverflowError):
+            index = None
+        if self.mapped and index == key:
+            for mapping in self.mapped:
+                if mapping[0] <= index < mapping[1]:
+                    if type(value) is self.value_type:
+                        mapping[2][index - mapping[0]] = value
+                        return
+                    # only with -t, it can't go in the file so the file stops being mapped and it goes wherever it goes
+                    self.unmap(mapping)
+                    break
+        if index is None or index != key or index < 0 or index >= len(self.present) + self.MAX_DENSE_GAP:
+            self.sparse[key] = value
+            return
+        if type(value) is not self.value_type:
+            # only happens with -t (like print's 0 going into the num heap), keep it exactly as it is in the dict
+            self.sparse[key] = value
+            if index < len(self.present):
+                self.present[index] = 0
+            return
+        if index >= len(self.present):
+            self.grow(index + 1)
+        self.values[index] = value
+        self.present[index] = 1
+        if self.sparse:
+            self.sparse.pop(key, None)
+
+    def grow(self, size):
+        extra = max(size, 2 * len(self.present)) - len(self.present)
+        self.present.extend(bytes(extra))
+        self.extendValues(extra)
+
+    # the bulk functions work on the count keys start, start + 1, ... all at once. when those keys are all in the array
+    # (or all in one mapped file) they work on it directly (with numpy if it's around), otherwise they go key by key
+    # through load and store
+    def rangeKeys(self, start, count):
+        return [start + i for i in range(count)]
+
+    # gives back (values, low, high) when the keys are values[low:high], values is the array or a mapped file's view
+    def denseRange(self, start, count, must_exist=True):
+        try:
+            low = int(start)
+        except (TypeError, ValueError, OverflowError):
+            return None
+        high = low + count
+        if low != start or low < 0:
+            return None
+        for mapped_low, mapped_high, view in self.mapped:
+            if low < mapped_high and mapped_low < high:
+                if mapped_low <= low and high <= mapped_high:
+                    return view, low - mapped_low, high - mapped_low
+                # half in a file and half somewhere else
+                return None
+        if must_exist:
+            if high > len(self.present) or self.present.find(0, low, high) != -1:
+                return None
+        elif high > len(self.present) + self.MAX_DENSE_GAP:
+            return None
+        return self.values, low, high
+
+    # makes low to high all exist in the array so they can be written straight into
+    def claimDense(self, low, high):
+        if high > len(self.present):
+            self.grow(high)
+        self.present[low:high] = b"\x01" * (high - low)
+        self.dropSparse(low, high)
+
+    def dropSparse(self, low, high):
+        for key in [key for key in self.sparse.keys() if type(key) is float and low <= key < high and key.is_integer()]:
+            del self.sparse[key]
+
+    def loadRange(self, start, count):
+        dense = self.denseRange(start, count)
+        if dense is None:
+            return [self.load(key) for key in self.rangeKeys(start, count)]
+        values, low, high = dense
+        return values[low:high]
+
+    # a mapped file going back to being normal entries (its values get copied into the array)
+    def unmap(self, mapping):
+        self.mapped.remove(mapping)
+        low, high, view = mapping
+        self.storeRange(low, view)
+
+class NumHeap(Heap):
+    def __init__(self):
+        super().__init__(array('d'), float)
+
+    def extendValues(self, extra):
+        self.values.frombytes(bytes(8 * extra))
+
+    def fill(self, start, count, value):
+        numpy = loadNumpy()
+        dense = self.denseRange(start, count, must_exist=False)
+        if dense is None or type(value) is not float:
+            for key in self.rangeKeys(start, count):
+                self.store(key, value)
+            return
+        values, low, high = dense
+        if values is self.values:
+            self.claimDense(low, high)
+        if numpy is not None:
+            numpy.frombuffer(values, dtype=numpy.float64)[low:high] = value
+        else:
+            values[low:high] = array('d', [value]) * (high - low)
+
+    def copy(self, source, count, destination):
+        # everything gets read before anything gets written so overlapping ranges work (a mapped file's range is a view
+        # into it, that has to be copied first)
+        values = self.loadRange(source, count)
+        self.storeRange(destination, array('d', values.tobytes()) if type(values) is memoryview else values)
+
+    # values go into start, start + 1, ... in order
+    def storeRange(self, start, values):
+        dense = self.denseRange(start, len(values), must_exist=False)
+        if dense is None or (type(values) is not array and type(values) is not memoryview and any(type(value) is not float for value in values)):
+            for key, value in zip(self.rangeKeys(start, len(values)), values):
+                self.store(key, value)
+            return
+        target, low, high = dense
+        if target is self.values:
+            self.claimDense(low, high)
+            values = array('d', values.tobytes()) if type(values) is memoryview else values
+        if type(values) is not array and type(values) is not memoryview:
+            values = array('d', values)
+        target[low:high] = values
+
+    def reduce(self, start, count, operation):
+        values = self.loadRange(start, count)
+        if operation == "sum":
+            # fsum is exactly rounded so the answer doesn't depend on the order things get added in
+            return math.fsum(values)
+        if count == 0:
+            raise KeyError(start)
+        numpy = loadNumpy()
+        if numpy is not None and (type(values) is array or type(values) is memoryview):
+            # numpy's min and max give back nan if there's a nan in there
+            values = numpy.frombuffer(values, dtype=numpy.float64)
+            return float(values.min() if operation == "min" else values.max())
+        if any(value != value for value in values):
+            return math.nan
+        return min(values) if operation == "min" else max(values)
+
+    def map(self, start, count, operation, scalar):
+        numpy = loadNumpy()
+        if operation == "/" and scalar == 0:
+            raise ZeroDivisionError
+        dense = self.denseRange(start, count)
+        if dense is not None and numpy is not None:
+            values, low, high = dense
+            view = numpy.frombuffer(values, dtype=numpy.float64)[low:high]
+            if operation == "+":
+                view += scalar
+            elif operation == "-":
+                view -= scalar
+            elif operation == "*":
+                view *= scalar
+            elif operation == "/":
+                view /= scalar
+            return
+        values = self.loadRange(start, count)
+        if operation == "+":
+            values = [value + scalar for value in values]
+        elif operation == "-":
+            values = [value - scalar for value in values]
+        elif operation == "*":
+            values = [value * scalar for value in values]
+        elif operation == "/":
+            values = [value / scalar for value in values]
+        if dense is not None:
+            dense[0][dense[1]:dense[2]] = array('d', values)
+        else:
+            for key, value in zip(self.rangeKeys(start, count), values):
+                self.store(key, value)
+
+    def sort(self, start, count):
+        numpy = loadNumpy()
+        dense = self.denseRange(start, count)
+        if dense is not None and numpy is not None:
+            # stable so -0.0 and 0.0 stay in the same order as the plain python sort leaves them
+            numpy.frombuffer(dense[0], dtype=numpy.float64)[dense[1]:dense[2]].sort(kind='stable')
+            return
+        values = self.loadRange(start, count)
+        if any(value != value for value in values):
+            # nan goes at the end like numpy does it
+            values = sorted(values, key=lambda value: (value != value, value))
+        else:
+            values = sorted(values)
+        if dense is not None:
+            dense[0][dense[1]:dense[2]] = array('d', values)
+        else:
+            for key, value in zip(self.rangeKeys(start, count), values):
+                self.store(key, value)
+
+    # the files are just 8 byte floats one after the other in this computer's byte order (what numpy's tofile and
+    # array's tofile write). the file gets mapped in copy on write, so nothing gets read until it gets looked at and
+    # the program changing it never changes the file, only savenum does
+    def mapFile(self, path, start):
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size % 8 != 0:
+                raise ValueError(f"it's {size} bytes long, which isn't a whole number of nums")
+            if size == 0:
+                # mmap can't do empty files and there's nothing to put anywhere anyway
+                return 0.0
+            view = memoryview(mmap.mmap(f.fileno(), size, access=mmap.ACCESS_COPY)).cast('d')
+        count = len(view)
+        try:
+            low = int(start)
+        except (TypeError, ValueError, OverflowError):
+            low = None
+        if low != start or low < 0:
+            # keys that can't be a slice of anything, they just get copied in
+            self.storeRange(start, view)
+            return float(count)
+        high = low + count
+        for mapping in [mapping for mapping in self.mapped if low < mapping[1] and mapping[0] < high]:
+            self.unmap(mapping)
+        if low < len(self.present):
+            self.present[low:min(high, len(self.present))] = bytes(min(high, len(self.present)) - low)
+        self.dropSparse(low, high)
+        self.mapped.append((low, high, view))
+        return float(count)
+
+    # numbers separated by commas, spaces or newlines, anything float() takes (inf and nan too)
+    def loadFile(self, path, start):
+        values = array('d')
+        with open(path, 'r') as f:
+            while True:
+                lines = f.readlines(1 << 20)
+                if len(lines) == 0:
+                    break
+                for field in " ".join(lines).replace(",", " ").split():
+                    try:
+                        values.append(float(field))
+                    except ValueError:
+                        raise ValueError(f"{field!r} isn't a num")
+        self.storeRange(start, values)
+        return float(len(values))
+
+    def saveFile(self, start, count, path):
+        dense = self.denseRange(start, count)
+        if dense is not None:
+            values, low, high = dense
+            data = memoryview(values)[low:high] if type(values) is array else values[low:high]
+        else:
+            # every key still has to be there, same as getnum
+            data = array('d', [float(value) for value in self.loadRange(start, count)])
+        writeWhole(path, 'wb', lambda f: f.write(data))
+        return float(count)
+
+class StringHeap(Heap):
+    def __init__(self):
+        super().__init__([], str)
+
+    def extendValues(self, extra):
+        self.values.extend([""] * extra)
+
+    def storeRange(self, start, values):
+        dense = self.denseRange(start, len(values), must_exist=False)
+        if dense is None:
+            for key, value in zip(self.rangeKeys(start, len(values)), values):
+                self.store(key, value)
+            return
+        target, low, high = dense
+        self.claimDense(low, high)
+        target[low:high] = values
+
+    # a .csv file is every field of every row in order, anything else is one string per line
+    def loadFile(self, path, start):
+        if path.endswith(".csv"):
+            with open(path, 'r', newline='') as f:
+                values = [field for row in csv.reader(f) for field in row]
+        else:
+            with open(path, 'r') as f:
+                values = f.read().splitlines()
+        self.storeRange(start, values)
+        return float(len(values))
+
+    def saveFile(self, start, count, path):
+        values = [materialize(value) for value in self.loadRange(start, count)]
+        if path.endswith(".csv"):
+            writeWhole(path, 'w', lambda f: csv.writer(f).writerows([value] for value in values), newline='')
+        else:
+            writeWhole(path, 'w', lambda f: f.writelines(f"{value}\n" for value in values))
+        return float(count)
+
+# writes a file next to path and renames it over it when it's done, so nothing ever sees half of it and a file that's
+# mapped in (and would blow up if it got shorter under it) keeps its old contents
+def writeWhole(path, mode, write, newline=None):
+    temporary = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temporary, mode, newline=newline) as f:
+            write(f)
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+# bools are packed one per byte
+class BoolHeap(Heap):
+    def __init__(self):
+        super().__init__(bytearray(), bool)
+
+    def load(self, key):
+        try:
+            index = int(key)
+        except (TypeError, ValueError, OverflowError):
+            return self.sparse[key]
+        if index == key and 0 <= index < len(self.present) and self.present[index]:
+            return self.values[index] == 1
+        return self.sparse[key]
+
+    def extendValues(self, extra):
+        self.values.extend(bytes(extra))
+
+# heaps that count how many entries get read and written, only used with --profile so the normal ones don't pay for it.
+# a bulk function counts every entry in its range once (even when it ends up going key by key through load and store)
+class CountingHeap():
+    def startCounting(self):
+        self.reads = 0
+        self.writes = 0
+        self.in_bulk = False
+
+    def load(self, key):
+        if not self.in_bulk:
+            self.reads += 1
+        return super().load(key)
+
+    def store(self, key, value):
+        if not self.in_bulk:
+            self.writes += 1
+        return super().store(key, value)
+
+    def bulk(self, reads, writes, operation, *args):
+        if self.in_bulk:
+            return operation(*args)
+        self.reads += reads
+        self.writes += writes
+        self.in_bulk = True
+        try:
+            return operation(*args)
+        finally:
+            self.in_bulk = False
+
+    # how many entries a file had isn't known until it's been read, every one of them counts as a write
+    def countLoaded(self, operation, *args):
+        count = self.bulk(0, 0, operation, *args)
+        self.writes += int(count)
+        return count
+
+class CountingNumHeap(CountingHeap, NumHeap):
+    def __init__(self):
+        super().__init__()
+        self.startCounting()
+
+    def loadRange(self, start, count):
+        return self.bulk(count, 0, super().loadRange, start, count)
+
+    def fill(self, start, count, value):
+        return self.bulk(0, count, super().fill, start, count, value)
+
+    def copy(self, source, count, destination):
+        return self.bulk(count, count, super().copy, source, count, destination)
+
+    def storeRange(self, start, values):
+        return self.bulk(0, len(values), super().storeRange, start, values)
+
+    def reduce(self, start, count, operation):
+        return self.bulk(count, 0, super().reduce, start, count, operation)
+
+    def map(self, start, count, operation, scalar):
+        return self.bulk(count, count, super().map, start, count, operation, scalar)
+
+    def sort(self, start, count):
+        return self.bulk(count, count, super().sort, start, count)
+
+    def mapFile(self, path, start):
+        return self.countLoaded(super().mapFile, path, start)
+
+    def loadFile(self, path, start):
+        return self.countLoaded(super().loadFile, path, start)
+
+    def saveFile(self, start, count, path):
+        return self.bulk(count, 0, super().saveFile, start, count, path)
+
+class CountingStringHeap(CountingHeap, StringHeap):
+    def __init__(self):
+        super().__init__()
+        self.startCounting()
+
+    def storeRange(self, start, values):
+        return self.bulk(0, len(values), super().storeRange, start, values)
+
+    def loadFile(self, path, start):
+        return self.countLoaded(super().loadFile, path, start)
+
+    def saveFile(self, start, count, path):
+        return self.bulk(count, 0, super().saveFile, start, count, path)
+
+class CountingBoolHeap(CountingHeap, BoolHeap):
+    def __init__(self):
+        super().__init__()
+        self.startCounting()
 
 class TreeToCode(lark.Transformer):
+    def __init__(self, source):
+        super().__init__()
+        self.source = source
+        # everything that gets type checked, in the order it has to be checked in
+        self.typechecks = []
+
     def string(self, s):
         [string, gender] = s
         return PrimitiveExpression(string, PrimitiveType.STR, gender)
@@ -131,7 +734,8 @@ class TreeToCode(lark.Transformer):
     
     ESCAPED_STRING = lambda _, s : s[1:-1]
 
-    MNAME = lambda _, s : s[:]
+    # every name gets interned so the same name all over a program is one string
+    MNAME = lambda _, s : sys.intern(str(s))
 
     name = lambda _, s: s[0]
 
@@ -151,7 +755,7 @@ class TreeToCode(lark.Transformer):
             output = s
         elif isinstance(s, str):
             output = VariableExpression(s)
-        output.meta = meta
+        output.position = packPosition(meta.line, meta.column)
         assert output is not None
         return output
     
@@ -174,14 +778,26 @@ class TreeToCode(lark.Transformer):
     def function_def(self, s, gender):
         return FunctionDefenition(s[0]["name"], s[0]["parameters"], ExecutableSequence(s[1:]), gender)
     
+    def whilo_loop(self, s):
+        return self.while_loop(s, GenderType.MALE)
+
+    def whila_loop(self, s):
+        return self.while_loop(s, GenderType.FEMALE)
+
+    def while_loop(self, s, gender):
+        # an empty body comes out as [None]
+        val = ExecutableLoop(s[0], ExecutableSequence([statement for statement in s[1:] if statement is not None]), gender)
+        self.typechecks.append(val)
+        return val
+
     def assignment(self, s):
         val = ExecutableAssignment(s[0], s[1])
-        typechecks.append(val)
+        self.typechecks.append(val)
         return val
     
     def creation(self, s):
         val = ExecutableCreation(GeneralType(s[1], s[0]), s[2], s[3])
-        typechecks.append(val)
+        self.typechecks.append(val)
         return val
     
     @lark.v_args(meta=True)
@@ -191,31 +807,103 @@ class TreeToCode(lark.Transformer):
         if args == [None]:
             args = []
         val = FunctionExpression(s[0], *args)
-        val.meta = meta
-        typechecks.append(val)
+        val.position = packPosition(meta.line, meta.column)
+        self.typechecks.append(val)
         return val
     
     def program(self, s):
-        return Program(s)
-
-def to_code(tree):
-    return TreeToCode().transform(tree)
+        return Program(s, self.typechecks, self.source)
+
+def to_code(tree, source):
+    return TreeToCode(source).transform(tree)
+
+# where a node is in the source, the line and column packed into one int (instead of keeping lark's meta object for every node)
+def packPosition(line, column):
+    return (line << 32) | column
+
+def positionLine(position):
+    return position >> 32
+
+def positionColumn(position):
+    return position & 0xFFFFFFFF
+
+# everything that goes wrong checking one file. it knows where every line of the file starts (worked out the first time
+# something needs a line, so a file without errors never pays for it) and an error only costs looking up its own line
+# instead of splitting up the whole file. listener gets every error the moment it's found (the text and a dict of the
+# parts, for --error-format json). once there are limit errors the rest only get counted, not turned into text or kept
+class Diagnostics():
+    def __init__(self, source):
+        self.source = source
+        self.line_starts = None
+        self.count = 0
+        self.limit = None
+        self.listener = None
+        # how many errors there were past limit
+        self.hidden = 0
+
+    def indexLines(self):
+        starts = array('q', [0])
+        find = self.source.find
+        index = find("\n")
+        while index != -1:
+            starts.append(index + 1)
+            index = find("\n", index + 1)
+        return starts
+
+    # lines start at 1 like lark's
+    def line(self, number) -> str:
+        if self.line_starts is None:
+            self.line_starts = self.indexLines()
+        if number < 1 or number > len(self.line_starts):
+            return ""
+        start = self.line_starts[number - 1]
+        end = self.source.find("\n", start)
+        text = self.source[start:] if end == -1 else self.source[start:end]
+        return text[:-1] if text.endswith("\r") else text
+
+    def context(self, position) -> str:
+        line = positionLine(position)
+        front_pad = " " * (positionColumn(position) + len(f"{line}: ") - 1) 
+        output = f"{line}: {self.line(line)}\n{front_pad}^"
+        return output
 
-def contextualizeErrorFromMeta(meta):
-    front_pad = " " * (meta.column + len(f"{meta.line}: ") - 1) 
-    output = f"{meta.line}: {content.splitlines()[meta.line - 1]}\n{front_pad}^"
-    return output
+    def format(self, message, position) -> str:
+        output = f"Error: \n{message}\n{self.context(position)}"
+        return output
 
-def createError(error, meta) -> str:
-    output = f"Error: \n{error}\n{contextualizeErrorFromMeta(meta)}"
-    return output
+    # gives back the error's text, or None if it's past limit (the first one always gets through, a program with errors
+    # has to have some)
+    def publish(self, message, position):
+        if self.limit is not None and self.count >= max(self.limit, 1):
+            self.hidden += 1
+            return None
+        self.count += 1
+        text = self.format(message, position)
+        if self.listener is not None:
+            line = positionLine(position)
+            self.listener(text, {"line": line, "column": positionColumn(position), "message": message, "source": self.line(line)})
+        return text
+
+    # what to say after the errors when some of them didn't get shown, None when they all did
+    def summary(self):
+        if self.hidden == 0:
+            return None
+        return f"Too Many Errors: {self.hidden} more errors not shown (--max-errors {self.limit}). Womp to the womp."
+
+# works out where a variable lives, either (True, index into the function frame) or (False, index into the globals)
+def resolveSlot(name, slots, global_slots):
+    if slots is not None and name in slots.keys():
+        return True, slots[name]
+    return False, global_slots[name]
 
 #expressions have these methods
-# get value (returns base python value)
+# get value (returns base python value, rt is the Runtime it's running in)
 # get type (returns the type of the expression) ("num" "str" "bool", "m", "f")
 
 class Expression():
-    def get_value(self):
+    __slots__ = ()
+
+    def get_value(self, rt):
         pass
     def get_primitive_type(self) -> PrimitiveType:
         pass
@@ -225,239 +913,645 @@ class Expression():
     def get_type(self) -> GeneralType:
         return GeneralType(self.get_primitive_type(), self.get_gender_type())
 
+    def markTailCall(self):
+        pass
+
+    # pure means it only looks at locals, constants and other pure stuff, so it gives the same thing for the same frame
+    def isPure(self, constants):
+        return False
+
+    # the local slots that always get read when this gets worked out (with --lazy-args, see Program.fillLazyArguments)
+    def readsForSure(self):
+        return set()
+
+    # what a call hands over instead of the value when this arg gets passed lazily (tree walker)
+    def delay(self, rt):
+        return Thunk(evaluateDelayed, (rt, self, rt.variable_frame_stack[-1]))
+
+    # gives back what should be run instead of this, anything that can be worked out before running gets worked out
+    def fold(self, program):
+        return self
+
 class Executable():
-    def execute(self):
+    __slots__ = ()
+
+    def execute(self, rt):
         pass
 
 @typechecked
 class PrimitiveExpression(Expression):
+    __slots__ = ('value', 'primitive_type', 'gender_type', 'value_type', 'position')
+
     def __init__(self, value, primitive_type: PrimitiveType, gender_type: GenderType):
         self.value = value
         self.primitive_type = primitive_type
         self.gender_type = gender_type
-    
-    def get_value(self):
+        self.value_type = GeneralType(primitive_type, gender_type)
+
+    def get_value(self, rt):
         return self.value
-    
+
     def get_primitive_type(self) -> PrimitiveType:
         return self.primitive_type
-    
+
     def get_gender_type(self) -> GenderType:
         return self.gender_type
-    
+
+    def get_type(self) -> GeneralType:
+        return self.value_type
+
     def __repr__(self):
         return f"{repr(self.value)} {self.gender_type} {self.primitive_type}"
-    
-    def setScope(self, scope):
+
+    def setScope(self, program, scope, slots=None):
         pass
 
+    def isPure(self, constants):
+        return True
+
 @typechecked
 class VariableExpression(Expression):
+    __slots__ = ('name', 'variable_type', 'slot', 'is_local', 'position')
+
     def __init__(self, name: str):
         self.name = name
-        self.parentScopeTypes = {}
-    
-    def get_value(self):
-        if self.name in variable_dict_stack[-1].keys():
-            return variable_dict_stack[-1][self.name]
+        self.variable_type = None
+        self.slot = None
+        self.is_local = False
+
+    def get_value(self, rt):
+        if self.is_local:
+            return rt.variable_frame_stack[-1][self.slot]
         else:
-            return variable_dict_globals[self.name]
-    
+            return rt.variable_globals[self.slot]
+
     def get_primitive_type(self) -> PrimitiveType:
-        if (self.name) in self.parentScopeTypes.keys():
-            return self.parentScopeTypes[self.name].get_primitive_type()
-        else:
-            assert (self.name) in variable_dict_globals_types.keys()
-            return variable_dict_globals_types[self.name].get_primitive_type()
-        
+        return self.variable_type.get_primitive_type()
+
     def get_gender_type(self) -> GenderType:
-        if (self.name) in self.parentScopeTypes.keys():
-            return self.parentScopeTypes[self.name].get_gender_type()
+        return self.variable_type.get_gender_type()
+
+    def get_type(self) -> GeneralType:
+        return self.variable_type
+
+    def setScope(self, program, scope, slots=None):
+        if (self.name) in scope.keys():
+            self.variable_type = scope[self.name]
+        elif (self.name) in program.variable_dict_globals_types.keys():
+            self.variable_type = program.variable_dict_globals_types[self.name]
         else:
-            assert (self.name) in variable_dict_globals_types.keys()
-            return variable_dict_globals_types[self.name].get_gender_type()
-        
-    def setScope(self, scope):
-        self.parentScopeTypes = scope
-        if not ((self.name) in scope.keys() or (self.name) in variable_dict_globals_types.keys()):
             message = f"cannot find variable: variable <{self.name}> does not exist in this scope"
-            published_errors.append(createError(message, self.meta))
+            program.publishError(message, self.position)
+            return
+        self.is_local, self.slot = resolveSlot(self.name, slots, program.variable_globals_slots)
+
+    def isPure(self, constants):
+        return self.is_local or self.name in constants
+
+    def readsForSure(self):
+        return {self.slot} if self.is_local else set()
+
+    # only locals get delayed, they get handed on as they are (a param can already be a Thunk)
+    def delay(self, rt):
+        return rt.variable_frame_stack[-1][self.slot]
+
+    def fold(self, program):
+        if self.is_local or self.name not in program.constants.keys():
+            return self
+        output = PrimitiveExpression(program.constants[self.name], self.get_primitive_type(), self.get_gender_type())
+        output.position = self.position
+        return output
+
+# reads a param that can still be a Thunk (only with --lazy-args), the first read works it out and keeps the value
+class LazyVariableExpression(VariableExpression):
+    __slots__ = ()
+
+    def __init__(self, variable):
+        self.name = variable.name
+        self.variable_type = variable.variable_type
+        self.slot = variable.slot
+        self.is_local = True
+        self.position = variable.position
+
+    def get_value(self, rt):
+        frame = rt.variable_frame_stack[-1]
+        value = frame[self.slot]
+        if type(value) is Thunk:
+            value = frame[self.slot] = value.force()
+        return value
 
 @typechecked
 class FunctionExpression(Expression, Executable):
+    __slots__ = ('name', 'args', 'definition', 'return_type', 'tail_call', 'delayed_args', 'position')
+
     def __init__(self, name: str, *args):
         self.name = name
         self.args = args
-    
-    def execute(self):
-        executor = functions_dict_globals[self.name]
-        executor(*self.args)
-    
+        # both filled in by setScope, definition is the FunctionDefenition when it's not a builtin
+        self.definition = None
+        self.return_type = None
+        # set when this call is the last thing its function does, then it hands back a TailCall instead of calling
+        self.tail_call = False
+        # with --lazy-args, a tuple of which args get passed as Thunks (None when they all get worked out first)
+        self.delayed_args = None
+
+    def execute(self, rt):
+        return self.get_value(rt)
+
     def get_primitive_type(self) -> PrimitiveType:
-        return functions_dict_globals_types[self.name].get_primitive_type()
-    
+        return self.return_type.get_primitive_type()
+
     def get_gender_type(self) -> GenderType:
-        return functions_dict_globals_types[self.name].get_gender_type()
-    
-    def get_value(self):
-        executor = functions_dict_globals[self.name]
-        return executor(*self.args)
-    
-    def setScope(self, scope):
-        if not ((self.name) in functions_dict_globals_types_params.keys()):
+        return self.return_type.get_gender_type()
+
+    def get_type(self) -> GeneralType:
+        return self.return_type
+
+    def get_value(self, rt):
+        if self.definition is None:
+            return rt.builtins[self.name](rt, *self.args)
+        function = rt.functions[self.definition.index]
+        if self.delayed_args is None:
+            values = [arg.get_value(rt) for arg in self.args]
+        else:
+            values = [arg.delay(rt) if delayed else arg.get_value(rt) for arg, delayed in zip(self.args, self.delayed_args)]
+        if self.tail_call:
+            return TailCall(function, values)
+        if function.memo is not None:
+            return function.memo.call(function, values)
+        #print(f"Executing function {self.name} {values}")
+        return trampoline(function, values)
+
+    def markTailCall(self):
+        # lazyif gives back whichever branch it picked so both branches are in tail position too
+        if self.name == "lazyif" and len(self.args) == 3:
+            self.args[1].markTailCall()
+            self.args[2].markTailCall()
+        elif self.definition is not None:
+            self.tail_call = True
+
+    def setScope(self, program, scope, slots=None):
+        if not ((self.name) in program.function_param_types.keys()):
             message = f"cannot find function: function <{self.name}()> does not exist"
-            published_errors.append(createError(message, self.meta))
+            program.publishError(message, self.position)
+        else:
+            self.definition = program.functions.get(self.name)
+            self.return_type = program.function_types[self.name]
         for arg in self.args:
-            arg.setScope(scope)
+            arg.setScope(program, scope, slots)
+
+    def isPure(self, constants):
+        if self.name in ("c", "type", "meta"):
+            # these never run their argument so it doesn't matter what it is
+            return True
+        if self.definition is not None:
+            if not self.definition.pure:
+                return False
+        elif self.name not in functions_pure_builtins:
+            return False
+        return all(arg.isPure(constants) for arg in self.args)
+
+    def readsForSure(self):
+        if self.name in ("c", "type", "meta"):
+            return set()
+        if self.name == "lazyif" and len(self.args) == 3:
+            # only what both branches read is read no matter which one it picks
+            return self.args[0].readsForSure() | (self.args[1].readsForSure() & self.args[2].readsForSure())
+        reads = set()
+        for i, arg in enumerate(self.args):
+            if not self.delaysArg(i):
+                reads |= arg.readsForSure()
+        return reads
+
+    # while Program.fillLazyArguments is still working things out delayed_args says which args could be delayed,
+    # they only are if the function doesn't read that param no matter what
+    def delaysArg(self, i):
+        return self.delayed_args is not None and self.delayed_args[i] and i not in self.definition.strict_params
+
+    def fold(self, program):
+        if self.name in ("c", "type", "meta"):
+            # these never run their argument, so it stays how it was written (type has to see it before it gets folded)
+            return self.folded(program, self.args)
+        self.args = tuple(arg.fold(program) for arg in self.args)
+        if self.name == "lazyif" and len(self.args) == 3 and isinstance(self.args[0], PrimitiveExpression):
+            return self.args[1] if self.args[0].value else self.args[2]
+        if self.name in functions_pure_builtins and all(isinstance(arg, PrimitiveExpression) for arg in self.args):
+            return self.folded(program, self.args)
+        return self
+
+    def folded(self, program, args):
+        try:
+            # pure builtins never touch the runtime except for meta, which only needs the program's source
+            # (a folded concat is a constant, it gets flattened now so it doesn't go into the cache as a Rope)
+            value = materialize(functions_dict_globals[self.name](program, *args))
+        except (Exception):
+            # dividing by zero and friends still have to blow up when (and if) the program gets there
+            return self
+        output = PrimitiveExpression(value, self.get_primitive_type(), self.get_gender_type())
+        output.position = self.position
+        return output
 
-    def typecheck(self):
-        if len(self.args) != len(functions_dict_globals_types_params[self.name]):
-            message = f"type mismatch: tried calling <{self.name}()> with {len(self.args)} arguments, but {len(functions_dict_globals_types_params[self.name])} arguments were expected"
-            published_errors.append(createError(message, self.meta))
+    def typecheck(self, program):
+        params = program.function_param_types[self.name]
+        if len(self.args) != len(params):
+            message = f"type mismatch: tried calling <{self.name}()> with {len(self.args)} arguments, but {len(params)} arguments were expected"
+            program.publishError(message, self.position)
             return
 
-        for i, (a, b) in enumerate(zip(self.args, functions_dict_globals_types_params[self.name])):
-            if (a.get_type() != b):
+        for i, (a, b) in enumerate(zip(self.args, params)):
+            if not a.get_type().matches(b, program.gender_check):
                 message = f"type mismatch: tried calling <{self.name}()> with an {a.get_type().pretty()} for argument {i + 1}, but {b.pretty()} was expected"
-                published_errors.append(createError(message, a.meta))
+                program.publishError(message, a.position)
+
+        if self.name == "parmapnum":
+            self.typecheckParallelMap(program)
+
+    # the function parmapnum runs has to be written right there, take and give back an m num and be pure (no print, heap
+    # or globals), everything else would come out different depending on which process got which part
+    def typecheckParallelMap(self, program):
+        target = self.args[0]
+        if not isinstance(target, PrimitiveExpression):
+            message = "type mismatch: <parmapnum()> needs the name of the function to run as a string right there in the call, not something it has to work out first"
+            program.publishError(message, target.position)
+            return
+        name = target.value
+        if name not in program.functions.keys():
+            message = f"cannot find function: function <{name}()> does not exist, so <parmapnum()> can't run it"
+            program.publishError(message, target.position)
+            return
+        num_type = GeneralType(PrimitiveType.NUM, GenderType.MALE)
+        params = program.function_param_types[name]
+        if len(params) != 1 or not params[0].matches(num_type, program.gender_check) or not program.function_types[name].matches(num_type, program.gender_check):
+            message = f"type mismatch: <parmapnum()> can only run functions that take one {num_type.pretty()} and give back an {num_type.pretty()}, <{name}()> takes ({', '.join(param.pretty() for param in params)}) and gives back an {program.function_types[name].pretty()}"
+            program.publishError(message, target.position)
+            return
+        if not program.functions[name].pure:
+            message = f"impure function: <{name}()> prints, uses the heap or a global (or calls something that does), so <parmapnum()> can't hand it out to other processes. They would all be fighting over it."
+            program.publishError(message, target.position)
+
 
-    
     def __repr__(self):
         return "<" + repr(self.name) + " " + repr(self.args) + ">"
 
 class ExecutableSequence(Executable):
+    __slots__ = ('expressions',)
+
     def __init__(self, expressions):
         self.expressions = expressions
-    
-    def execute(self):
+
+    def execute(self, rt):
+        result = None
         for expression in self.expressions:
-            expression.execute()
-    
+            result = expression.execute(rt)
+        return result
+
     def __repr__(self):
         return "<ExecutableSequence: " + repr(self.expressions) + ">"
-    
+
+    def fold(self, program):
+        self.expressions = foldStatements(self.expressions, program)
+        return self
+
+# statements that fold into something that doesn't do anything (c() comments, constants, variables) get dropped
+def foldStatements(statements, program):
+    output = []
+    for statement in statements:
+        statement = statement.fold(program)
+        if isinstance(statement, (Executable, FunctionDefenition)):
+            output.append(statement)
+    return output
+
+# every statement in statements and everything inside the loops in there (not inside functions though)
+def flattenStatements(statements):
+    for statement in statements:
+        yield statement
+        if isinstance(statement, ExecutableLoop):
+            yield from flattenStatements(statement.executable_sequence.expressions)
+
+# swaps every read of one of slots (params that can be Thunks) in statements for a LazyVariableExpression
+def markLazyReads(statements, slots):
+    for statement in statements:
+        if isinstance(statement, FunctionExpression):
+            markLazyRead(statement, slots)
+        elif isinstance(statement, ExecutableLoop):
+            statement.condition = markLazyRead(statement.condition, slots)
+            markLazyReads(statement.executable_sequence.expressions, slots)
+        else:
+            statement.expression = markLazyRead(statement.expression, slots)
+
+def markLazyRead(expression, slots):
+    if isinstance(expression, FunctionExpression):
+        expression.args = tuple(markLazyRead(arg, slots) for arg in expression.args)
+    elif type(expression) is VariableExpression and expression.is_local and expression.slot in slots:
+        return LazyVariableExpression(expression)
+    return expression
+
+# whilo/whila. the body just runs in whatever frame it's in (variables created in it belong to the function, or are globals
+# at the top level) so going around again costs nothing but running the body, no call, no frame and no stack
+class ExecutableLoop(Executable):
+    __slots__ = ('condition', 'executable_sequence', 'gender')
+
+    def __init__(self, condition, executable_sequence, gender: GenderType):
+        self.condition = condition
+        self.executable_sequence = executable_sequence
+        self.gender = gender
+
+    def execute(self, rt):
+        condition = self.condition
+        statements = self.executable_sequence.expressions
+        while condition.get_value(rt):
+            for statement in statements:
+                statement.execute(rt)
+
+    def __repr__(self):
+        return "<ExecutableLoop: " + repr({"condition": self.condition, "executable_sequence": self.executable_sequence}) + ">"
+
+    def setScope(self, program, scope, slots=None):
+        self.condition.setScope(program, scope, slots)
+        for statement in self.executable_sequence.expressions:
+            statement.setScope(program, scope, slots)
+
+    def isPure(self, constants):
+        return self.condition.isPure(constants) and all(statement.isPure(constants) for statement in self.executable_sequence.expressions)
+
+    def fold(self, program):
+        self.condition = self.condition.fold(program)
+        if isinstance(self.condition, PrimitiveExpression) and not self.condition.value:
+            # never runs, so it goes the same way c() does
+            return self.condition
+        self.executable_sequence.fold(program)
+        return self
+
+    def typecheck(self, program):
+        my_type = self.condition.get_type()
+        other_my_tpye = GeneralType(PrimitiveType.BOOL, self.gender)
+        if not my_type.matches(other_my_tpye, program.gender_check):
+            message = f"type mismatch: tried looping for as long as an {my_type.pretty()} is true, but <{'whilo' if self.gender == GenderType.MALE else 'whila'}> only listens to {other_my_tpye.pretty()}s"
+            program.publishError(message, self.condition.position)
+
 class ExecutableAssignment(Executable):
+    __slots__ = ('name', 'expression', 'variable_type', 'is_local', 'slot')
+
     def __init__(self, name, expression):
         self.name = name
         self.expression = expression
-    
-    def execute(self):
-        if self.name in variable_dict_stack[-1].keys():
-            variable_dict_stack[-1][self.name] = self.expression.get_value()
+
+    def execute(self, rt):
+        if self.is_local:
+            rt.variable_frame_stack[-1][self.slot] = self.expression.get_value(rt)
         else:
-            assert (self.name) in variable_dict_globals.keys() 
-            variable_dict_globals[self.name] = self.expression.get_value()
-    
+            rt.variable_globals[self.slot] = self.expression.get_value(rt)
+
     def __repr__(self):
         return "<ExecutableAssignment: " + repr({ "name": self.name, "expression": self.expression}) + ">"
 
-    def setScope(self, scope):
-        self.expression.setScope(scope)
-        self.scope = scope
-        if not ((self.name) in scope.keys() or (self.name) in variable_dict_globals_types.keys()):
+    def setScope(self, program, scope, slots=None):
+        self.expression.setScope(program, scope, slots)
+        # the type of whatever gets assigned to, looked up once here so type checking doesn't have to
+        if (self.name) in scope.keys():
+            self.variable_type = scope[self.name]
+        elif (self.name) in program.variable_dict_globals_types.keys():
+            self.variable_type = program.variable_dict_globals_types[self.name]
+        else:
             message = f"cannot find variable: variable <{self.name}> does not exist in this scope"
-            published_errors.append(createError(message, self.expression.meta))
+            program.publishError(message, self.expression.position)
+            return
+        self.is_local, self.slot = resolveSlot(self.name, slots, program.variable_globals_slots)
+
+    def isPure(self, constants):
+        return self.is_local and self.expression.isPure(constants)
+
+    def fold(self, program):
+        self.expression = self.expression.fold(program)
+        return self
 
-    def typecheck(self):
+    def typecheck(self, program):
         my_type = self.expression.get_type()
-        other_my_tpye = self.scope[self.name]
-        if (my_type != other_my_tpye):
+        other_my_tpye = self.variable_type
+        if not my_type.matches(other_my_tpye, program.gender_check):
             message = f"type mismatch: tried assigning an {my_type.pretty()} to <{self.name}>, but <{self.name}> has type {other_my_tpye.pretty()}"
-            published_errors.append(createError(message, self.expression.meta))
+            program.publishError(message, self.expression.position)
 
 class ExecutableCreation(Executable):
+    __slots__ = ('general_type', 'name', 'expression', 'is_local', 'slot')
+
     def __init__(self, general_type, name, expression):
         self.general_type = general_type
         self.name = name
         self.expression = expression
-    
-    def execute(self):
-        if self.name in variable_dict_stack[-1].keys():
-            variable_dict_stack[-1][self.name] = self.expression.get_value()
+
+    def execute(self, rt):
+        if self.is_local:
+            rt.variable_frame_stack[-1][self.slot] = self.expression.get_value(rt)
         else:
-            assert (self.name) in variable_dict_globals.keys()
-            variable_dict_globals[self.name] = self.expression.get_value()
-    
+            rt.variable_globals[self.slot] = self.expression.get_value(rt)
+
     def __repr__(self):
         return "<ExecutableCreation: " + repr({"general_type": self.general_type, "name": self.name, "expression": self.expression}) + ">"
 
-    def setScope(self, scope):
-        self.expression.setScope(scope)
+    def setScope(self, program, scope, slots=None):
+        self.expression.setScope(program, scope, slots)
+        self.is_local, self.slot = resolveSlot(self.name, slots, program.variable_globals_slots)
 
-    def typecheck(self):
+    def isPure(self, constants):
+        return self.is_local and self.expression.isPure(constants)
+
+    def fold(self, program):
+        self.expression = self.expression.fold(program)
+        return self
+
+    def typecheck(self, program):
         my_type = self.expression.get_type()
         other_my_tpye = self.general_type
-        if (my_type != other_my_tpye):
+        if not my_type.matches(other_my_tpye, program.gender_check):
             message = f"type mismatch: tried assigning an {my_type.pretty()} to <{self.name}>, but <{self.name}> has type {other_my_tpye.pretty()}"
-            published_errors.append(createError(message, self.expression.meta))
+            program.publishError(message, self.expression.position)
 
 class FunctionDefenition():
+    __slots__ = ('name', 'executable_sequence', 'params', 'slots', 'frame_template', 'locals_template', 'param_slots',
+                 'param_count', 'return_slot', 'type_scope', 'gender', 'index', 'pure', 'strict_params', 'lazy_slots')
+
     def __init__(self, name, params, executable_sequence, gender: GenderType):
         self.name = name
         self.executable_sequence = executable_sequence
         self.params = params
-        self.scope = {}
+        # every param and created variable gets a slot, a call copies frame_template into a fresh frame
+        self.slots = {}
+        self.frame_template = []
+        self.locals_template = []
+        self.param_slots = []
+        self.param_count = 0
+        self.return_slot = None
         self.type_scope = {}
         self.gender = gender
+        # where this function's TreeFunction/memo is in a Runtime, filled in by Program.fillFunctionExecutionDefinitions
+        self.index = None
+        # filled in by Program.fillPureFunctions, pure functions get a FunctionMemo in every Runtime
+        self.pure = False
+        # sets filled in by Program.fillLazyArguments (--lazy-args), None without it. strict_params are the indexes of the
+        # params that always get read, lazy_slots the param slots that some call hands a Thunk (those don't get a FunctionMemo)
+        self.strict_params = None
+        self.lazy_slots = None
+
+    def addSlot(self, name, creation_type):
+        self.slots[name] = len(self.frame_template)
+        if creation_type == PrimitiveType.NUM:
+            self.frame_template.append(0.0)
+        elif creation_type == PrimitiveType.STR:
+            self.frame_template.append("")
+        elif creation_type == PrimitiveType.BOOL:
+            self.frame_template.append(False)
+
+    # for variables that didn't come from the source (inlined functions), they go after everything else
+    def addInlinedSlot(self, name, general_type):
+        assert(name not in self.slots.keys())
+        self.addSlot(name, general_type.get_primitive_type())
+        self.type_scope[name] = general_type
+        self.locals_template = self.frame_template[self.param_count:]
 
-    def executeFunction(self, *args):
-        #print(f"Executing function {self.name} {args}")
-        temp_scope = self.scope.copy()
-        for i, value in enumerate(args):
-            assert (list(self.params.keys())[i]) in temp_scope
-            temp_scope[list(self.params.keys())[i]] = value.get_value()
-        variable_dict_stack.append(temp_scope)
-        self.executable_sequence.execute()
-        output = 0.0
-        if ("returno" in variable_dict_stack[-1].keys()):
-            output = variable_dict_stack[-1]["returno"]
-        elif ("returna" in variable_dict_stack[-1].keys()):
-            output = variable_dict_stack[-1]["returna"]
-        variable_dict_stack.pop()
-        return output
-    
     def fillVariablesScopedExecutionDefinitions(self):
         for param, type_of_param in self.params.items():
-            assert(param not in self.scope.keys())
-            creation_type = type_of_param.get_primitive_type()
-            if creation_type == PrimitiveType.NUM:
-                self.scope[param] = 0.0
-            elif creation_type == PrimitiveType.STR:
-                self.scope[param] = ""
-            elif creation_type == PrimitiveType.BOOL:
-                self.scope[param] = False
+            assert(param not in self.slots.keys())
+            self.addSlot(param, type_of_param.get_primitive_type())
+            self.param_slots.append(self.slots[param])
             self.type_scope[param] = type_of_param
 
-        for statement in self.executable_sequence.expressions:
+        for statement in flattenStatements(self.executable_sequence.expressions):
             if isinstance(statement, ExecutableCreation):
-                assert(statement.name not in self.scope.keys())
-                creation_type = statement.general_type.get_primitive_type()
-                if creation_type == PrimitiveType.NUM:
-                    self.scope[statement.name] = 0.0
-                elif creation_type == PrimitiveType.STR:
-                    self.scope[statement.name] = ""
-                elif creation_type == PrimitiveType.BOOL:
-                    self.scope[statement.name] = False
+                assert(statement.name not in self.slots.keys())
+                self.addSlot(statement.name, statement.general_type.get_primitive_type())
                 self.type_scope[statement.name] = statement.general_type
-    
-    def fillOutScope(self):
+
+        self.param_count = len(self.param_slots)
+        self.locals_template = self.frame_template[self.param_count:]
+
+        if ("returno" in self.slots.keys()):
+            self.return_slot = self.slots["returno"]
+        elif ("returna" in self.slots.keys()):
+            self.return_slot = self.slots["returna"]
+
+    def fillOutScope(self, program):
         for statement in self.executable_sequence.expressions:
-            statement.setScope(self.type_scope)
+            statement.setScope(program, self.type_scope, self.slots)
+
+    def markTailCalls(self):
+        if len(self.executable_sequence.expressions) == 0:
+            return
+        last = self.executable_sequence.expressions[-1]
+        if isinstance(last, FunctionExpression):
+            # the value of the last call only gets thrown away if there's no returno/returna to give back instead
+            if self.return_slot is None:
+                last.markTailCall()
+        elif isinstance(last, ExecutableLoop):
+            # the loop has to check its condition again after the call, it's never the last thing
+            return
+        elif last.is_local and last.slot == self.return_slot:
+            last.expression.markTailCall()
 
+    def isPure(self, constants):
+        return all(statement.isPure(constants) for statement in self.executable_sequence.expressions)
+
+    # the indexes of the params whose value always gets read before anything could have assigned to them. every
+    # statement runs but a loop body might not, so whatever a loop assigns doesn't count as the param anymore after it
+    def findStrictParams(self):
+        reads = set()
+        assigned = set()
+        for statement in self.executable_sequence.expressions:
+            if isinstance(statement, FunctionExpression):
+                reads |= statement.readsForSure() - assigned
+            elif isinstance(statement, ExecutableLoop):
+                reads |= statement.condition.readsForSure() - assigned
+                for inner in flattenStatements(statement.executable_sequence.expressions):
+                    if isinstance(inner, (ExecutableAssignment, ExecutableCreation)) and inner.is_local:
+                        assigned.add(inner.slot)
+            else:
+                reads |= statement.expression.readsForSure() - assigned
+                if statement.is_local:
+                    assigned.add(statement.slot)
+        # the trampoline reads the return value (a param can be called returno too)
+        if self.return_slot is not None and self.return_slot not in assigned:
+            reads.add(self.return_slot)
+        return {i for i, slot in enumerate(self.param_slots) if slot in reads}
+
+    # the names of the user defined functions isPure ends up asking about (everything but what's inside c/type/meta)
+    def calledFunctions(self):
+        found = set()
+        waiting = list(self.executable_sequence.expressions)
+        while len(waiting) != 0:
+            node = waiting.pop()
+            if isinstance(node, FunctionExpression):
+                if node.name in ("c", "type", "meta"):
+                    continue
+                if node.definition is not None:
+                    found.add(node.name)
+                waiting.extend(node.args)
+            elif isinstance(node, (ExecutableAssignment, ExecutableCreation)):
+                waiting.append(node.expression)
+            elif isinstance(node, ExecutableLoop):
+                waiting.append(node.condition)
+                waiting.extend(node.executable_sequence.expressions)
+        return found
+
+    def fold(self, program):
+        self.executable_sequence.fold(program)
+        return self
 
     def __repr__(self):
         return "<FunctionDefenition: " + repr({"name": self.name, "params": self.params, "executable_sequence": self.executable_sequence}) + ">"
-    
+
+# a parsed program and everything checking it found out. nothing in here changes once it's checked, so one Program can
+# be run as many times as you want (even at the same time), every run gets its own Runtime
 class Program():
-    def __init__(self, statements):
+    def __init__(self, statements, typechecks, source):
         self.statements = [statement for statement in statements if statement is not None]
-    
+        # these are some lists that include all of certain created types to run type checking and stuff on them in a correct order
+        self.typechecks = typechecks
+        self.diagnostics = Diagnostics(source)
+        self.errors = []
+        # what Interpreter.compile cached it under (None without a cache), -e python names its module after it
+        self.cache_key = None
+        self.gender_check = True
+        # falso/truo/falsa/trua until fillConstants works out which of them really are
+        self.constants = {}
+
+        # basically this contains the starting values of all the global variables, variable_globals_slots says which index each name lives at
+        self.variable_globals = [False, True, False, True]
+        self.variable_globals_slots = {
+            "falso": 0,
+            "truo": 1,
+            "falsa": 2,
+            "trua": 3
+        }
+
+        # this is a dict of all the global variable types
+        self.variable_dict_globals_types = {
+            "falso": GeneralType(PrimitiveType.BOOL, GenderType.MALE),
+            "truo": GeneralType(PrimitiveType.BOOL, GenderType.MALE),
+            "falsa": GeneralType(PrimitiveType.BOOL, GenderType.FEMALE),
+            "trua": GeneralType(PrimitiveType.BOOL, GenderType.FEMALE)
+        }
+
+        # the FunctionDefenition behind every user defined function (builtins aren't in here)
+        self.functions = {}
+        # same as functions_dict_globals_types(_params) but with the user defined functions in there too
+        self.function_types = dict(functions_dict_globals_types)
+        self.function_param_types = dict(functions_dict_globals_types_params)
+
+    def publishError(self, message, position):
+        text = self.diagnostics.publish(message, position)
+        if text is not None:
+            self.errors.append(text)
+
+    def contextualize(self, position):
+        return self.diagnostics.context(position)
+
     def fillFunctionExecutionDefinitions(self):
         for statement in self.statements:
             if isinstance(statement, FunctionDefenition):
-                assert statement.name not in functions_dict_globals.keys()
-                functions_dict_globals[statement.name] = statement.executeFunction
-                functions_dict_globals_types_params[statement.name] = statement.params.values()
+                assert statement.name not in self.function_types.keys()
+                statement.index = len(self.functions)
+                self.functions[statement.name] = statement
+                self.function_param_types[statement.name] = list(statement.params.values())
                 output = GeneralType(PrimitiveType.NUM, statement.gender)
                 if ("returno" in statement.type_scope):
                     output = statement.type_scope["returno"]
@@ -465,166 +1559,1981 @@ class Program():
                 elif ("returna" in statement.type_scope):
                     output = statement.type_scope["returna"]
                     #assert(output.get_gender_type() == statement.gender)
-                functions_dict_globals_types[statement.name] = output
-                
-    
+                self.function_types[statement.name] = output
+
+
     def fillVariableExecutionDefinitions(self):
-        for statement in self.statements:
+        for statement in flattenStatements(self.statements):
             if isinstance(statement, ExecutableCreation):
-                assert statement.name not in variable_dict_globals.keys()
+                assert statement.name not in self.variable_globals_slots.keys()
+                self.variable_globals_slots[statement.name] = len(self.variable_globals)
                 creation_type = statement.general_type.get_primitive_type()
                 if creation_type == PrimitiveType.NUM:
-                    variable_dict_globals[statement.name] = 0.0
+                    self.variable_globals.append(0.0)
                 elif creation_type == PrimitiveType.STR:
-                    variable_dict_globals[statement.name] = ""
+                    self.variable_globals.append("")
                 elif creation_type == PrimitiveType.BOOL:
-                    variable_dict_globals[statement.name] = False
-                variable_dict_globals_types[statement.name] = statement.general_type
+                    self.variable_globals.append(False)
+                self.variable_dict_globals_types[statement.name] = statement.general_type
 
     def fillVariableScopedExecutionDefinitions(self):
         for statement in self.statements:
             if isinstance(statement, FunctionDefenition):
                 statement.fillVariablesScopedExecutionDefinitions()
-    
+
     def fillVariableExpressionTypes(self):
         for statement in self.statements:
             if isinstance(statement, FunctionDefenition):
-                statement.fillOutScope()
+                statement.fillOutScope(self)
             else:
-                statement.setScope(variable_dict_globals_types)
-    
-    def executeProgram(self):
+                statement.setScope(self, self.variable_dict_globals_types)
+
+    def fillTailCalls(self):
+        for statement in self.statements:
+            if isinstance(statement, FunctionDefenition):
+                statement.markTailCalls()
+
+    # truo, falso, trua and falsa are globals too, they only count as constants if nothing ever assigns to them
+    def fillConstants(self):
+        assigned = set()
+        for statement in self.statements:
+            if isinstance(statement, FunctionDefenition):
+                for inner in flattenStatements(statement.executable_sequence.expressions):
+                    if isinstance(inner, ExecutableAssignment) and not inner.is_local:
+                        assigned.add(inner.name)
+            else:
+                for inner in flattenStatements([statement]):
+                    if isinstance(inner, ExecutableAssignment):
+                        assigned.add(inner.name)
+        self.constants = {name: self.variable_globals[self.variable_globals_slots[name]] for name in ["falso", "truo", "falsa", "trua"] if name not in assigned}
+
+    def foldConstants(self):
+        self.fillConstants()
+        self.statements = foldStatements(self.statements, self)
+
+    def fillPureFunctions(self):
+        self.fillConstants()
+        functions = list(self.functions.values())
+
+        # everything starts out pure, so isPure only finds the functions that are impure on their own. those knock out
+        # everything that calls them, which knocks out everything that calls those and so on. functions that call
+        # each other (or themselves) stay pure as long as nothing they end up running isn't
+        callers = {function.name: [] for function in functions}
+        for function in functions:
+            function.pure = True
+            for callee in function.calledFunctions():
+                callers[callee].append(function)
+        waiting = [function for function in functions if not function.isPure(self.constants)]
+        for function in waiting:
+            function.pure = False
+        while len(waiting) != 0:
+            for caller in callers[waiting.pop().name]:
+                if caller.pure:
+                    caller.pure = False
+                    waiting.append(caller)
+
+    # call by need (--lazy-args). an arg that is pure and calls one of your functions gets handed over as a Thunk that
+    # only gets worked out the first time the param is read, if it ever is. that's only worth it for params the function
+    # doesn't read no matter what, so those get found first: everything starts out strict and a function that turns out
+    # to not always read a param puts its callers back in line (their args to it might not get worked out anymore).
+    # args that print, use the heap or read globals always get worked out first and in order, like before
+    def fillLazyArguments(self):
+        functions = list(self.functions.values())
+        callers = {function.name: [] for function in functions}
+        for function in functions:
+            function.strict_params = set(range(function.param_count))
+            function.lazy_slots = set()
+            for callee in function.calledFunctions():
+                callers[callee].append(function)
+
+        calls = []
+        for statement in self.statements:
+            caller = statement if isinstance(statement, FunctionDefenition) else None
+            for node in walkNodes(statement):
+                if isinstance(node, FunctionExpression) and node.definition is not None:
+                    delayed = tuple(i < node.definition.param_count and self.canDelay(arg, caller) for i, arg in enumerate(node.args))
+                    node.delayed_args = delayed if any(delayed) else None
+                    if node.delayed_args is not None:
+                        calls.append((caller, node))
+
+        waiting = list(functions)
+        queued = set(function.name for function in functions)
+        while len(waiting) != 0:
+            function = waiting.pop()
+            queued.discard(function.name)
+            strict = function.findStrictParams() & function.strict_params
+            if strict != function.strict_params:
+                function.strict_params = strict
+                for caller in callers[function.name]:
+                    if caller.name not in queued:
+                        queued.add(caller.name)
+                        waiting.append(caller)
+
+        for caller, call in calls:
+            # a param only gets handed on as it is if the caller didn't have to work it out either
+            delayed = tuple(call.delaysArg(i) and (not isinstance(arg, VariableExpression) or caller.param_slots.index(arg.slot) not in caller.strict_params)
+                            for i, arg in enumerate(call.args))
+            call.delayed_args = delayed if any(delayed) else None
+            for i in range(len(delayed)):
+                if delayed[i]:
+                    call.definition.lazy_slots.add(call.definition.param_slots[i])
+        for function in functions:
+            if len(function.lazy_slots) != 0:
+                markLazyReads(function.executable_sequence.expressions, function.lazy_slots)
+
+    # caller is the FunctionDefenition the call is in (None at the top level)
+    def canDelay(self, arg, caller):
+        if isinstance(arg, VariableExpression):
+            # handing on a param doesn't have to work it out (it might not have been worked out yet either)
+            return caller is not None and arg.is_local and arg.slot in caller.param_slots
+        # the builtins are all cheaper to just run than to make a Thunk for
+        return isinstance(arg, FunctionExpression) and arg.isPure(self.constants) and \
+            any(isinstance(node, FunctionExpression) and node.definition is not None for node in walkNodes(arg))
+
+    def executeProgram(self, rt):
         for statement in self.statements:
             if isinstance(statement, Executable):
-                statement.execute()
-    
-    def typecheck(self):
-        for statement in typechecks:
-            statement.typecheck()
+                statement.execute(rt)
+
+    def typecheck(self, gender_check):
+        self.gender_check = gender_check
+        # parmapnum checks that the function it runs is pure (this gets worked out again after optimizing)
+        self.fillPureFunctions()
+        for statement in self.typechecks:
+            statement.typecheck(self)
 
     def __repr__(self):
         return "<Program: " + repr(self.statements) + ">"
 
-def addSimpleExecutableFunctionDefinition(name: str, evaluer: Any, params: dict):
+# where print (and the errors that happen while running) go. the program hands it whole lines (without the newline) and
+# it decides when they actually get written, flush writes whatever it's holding on to
+class OutputSink():
+    def writeLine(self, line):
+        pass
+
+    def flush(self):
+        pass
+
+# writes to a file (stdout usually). line buffering writes every line right away, block buffering saves lines up until
+# there's buffer_size characters of them and writes them all at once (one write instead of one per print).
+# auto is line for terminals (so you see it as it happens) and block for pipes and files
+class StreamSink(OutputSink):
+    def __init__(self, stream, buffering='auto', buffer_size=1 << 16):
+        if buffering == 'auto':
+            buffering = 'line' if hasattr(stream, 'isatty') and stream.isatty() else 'block'
+        self.stream = stream
+        self.line_buffered = buffering == 'line'
+        self.buffer_size = buffer_size
+        self.lines = []
+        self.size = 0
+
+    def writeLine(self, line):
+        if self.line_buffered:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+            return
+        self.lines.append(line)
+        self.size += len(line) + 1
+        if self.size >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if len(self.lines) != 0:
+            self.lines.append("")
+            self.stream.write("\n".join(self.lines))
+            self.lines = []
+            self.size = 0
+        self.stream.flush()
+
+# keeps everything in memory, for using the interpreter from python (it's what run uses when it isn't given an output)
+class MemorySink(OutputSink):
+    def __init__(self):
+        self.lines = []
+
+    def writeLine(self, line):
+        self.lines.append(line)
+
+    def getvalue(self) -> str:
+        return "".join(line + "\n" for line in self.lines)
+
+# everything that changes while a Program runs, a fresh one (fresh globals, frames and heaps) for every run
+class Runtime():
+    def __init__(self, program, output, memo_size, profiler=None):
+        self.program = program
+        # where print goes, an OutputSink
+        self.output = output
+        self.variable_globals = list(program.variable_globals)
+        # same thing as above but stacking for function scope (tree walker only), every function call pushes a frame (a list the size of the function's scope)
+        self.variable_frame_stack = [[]]
+        # None unless this run is being profiled, everything that gets timed or counted is swapped for a version that does
+        # that here so runs that aren't profiled don't check anything
+        self.profiler = profiler
+        if profiler is None:
+            self.string_heap = StringHeap()
+            self.num_heap = NumHeap()
+            self.bool_heap = BoolHeap()
+            self.builtins = functions_dict_globals
+        else:
+            self.string_heap = CountingStringHeap()
+            self.num_heap = CountingNumHeap()
+            self.bool_heap = CountingBoolHeap()
+            self.builtins = {name: profiler.wrap(name, evaluer, True) for name, evaluer in functions_dict_globals.items()}
+            profiler.heaps = {"num": self.num_heap, "str": self.string_heap, "bool": self.bool_heap}
+        # one per function (by FunctionDefenition.index), None when it isn't pure or memos are off. functions that can get
+        # Thunks don't get one either, the args would all have to be worked out to look the result up
+        self.memos = [FunctionMemo(memo_size) if function.pure and memo_size is not None and not function.lazy_slots else None
+                      for function in program.functions.values()]
+        self.functions = [TreeFunction(function, self, self.memos[function.index]) for function in program.functions.values()]
+        if profiler is not None:
+            for function in self.functions:
+                function.runFrame = profiler.wrap(function.definition.name, function.runFrame, False)
+        # the ParallelMap parmapnum uses, CompiledProgram.run sets it up
+        self.parallel = None
+
+    def contextualize(self, position):
+        return self.program.contextualize(position)
+
+# what the tree walker actually calls for a FunctionDefenition in one Runtime, the trampoline runs these
+class TreeFunction():
+    def __init__(self, definition, rt, memo):
+        self.definition = definition
+        self.rt = rt
+        self.memo = memo
+        self.body = definition.executable_sequence
+        self.frame_template = definition.frame_template
+        self.locals_template = definition.locals_template
+        self.param_slots = definition.param_slots
+        self.param_count = definition.param_count
+        self.return_slot = definition.return_slot
+
+    def runFrame(self, frame):
+        stack = self.rt.variable_frame_stack
+        stack.append(frame)
+        result = self.body.execute(self.rt)
+        stack.pop()
+        return result
+
+# copies the bodies of small functions that can't end up calling themselves into the places they get called from so
+# those calls don't have to set up a frame and go through the trampoline.
+# a call that is a whole statement (or the whole right side of one) inside a function gets the body pasted in with every
+# param and local renamed to <function>.<n>.<name> (the dots mean nothing in the source can be called that), and the
+# params get created from the args first so they run once and in order like they would for a call.
+# a call anywhere else only gets inlined if the body is just the return value and every arg is a literal, a local or
+# a constant, since then putting the args straight into it can't change what happens or when
+class Inliner():
+    def __init__(self, program, size):
+        self.program = program
+        self.size = size
+        self.inlined_count = 0
+        program.fillConstants()
+        self.constants = program.constants
+        self.functions = program.functions
+        self.recursive = set()
+
+    def inlineProgram(self):
+        calls = {name: self.findCalls(function.executable_sequence.expressions) for name, function in self.functions.items()}
+        for name in self.functions.keys():
+            reached = set()
+            waiting = list(calls[name])
+            while len(waiting) != 0:
+                callee = waiting.pop()
+                if callee not in reached:
+                    reached.add(callee)
+                    waiting.extend(calls[callee])
+            if name in reached:
+                self.recursive.add(name)
+
+        # functions get done after everything they call so what gets pasted in is already inlined itself
+        order = []
+        def visit(name, visiting):
+            if name in order or name in visiting:
+                return
+            visiting.add(name)
+            for callee in calls[name]:
+                visit(callee, visiting)
+            order.append(name)
+        for name in self.functions.keys():
+            visit(name, set())
+
+        for name in order:
+            function = self.functions[name]
+            function.executable_sequence.expressions = self.inlineBody(function, function.executable_sequence.expressions)
+        self.program.statements = self.inlineBody(None, self.program.statements)
+        return self.inlined_count
+
+    def findCalls(self, nodes):
+        found = set()
+        for node in nodes:
+            if isinstance(node, FunctionExpression):
+                if node.name in self.functions.keys():
+                    found.add(node.name)
+                found |= self.findCalls(node.args)
+            elif isinstance(node, (ExecutableAssignment, ExecutableCreation)):
+                found |= self.findCalls([node.expression])
+            elif isinstance(node, ExecutableLoop):
+                found |= self.findCalls([node.condition, *node.executable_sequence.expressions])
+        return found
+
+    def countNodes(self, nodes):
+        count = 0
+        for node in nodes:
+            count += 1
+            if isinstance(node, FunctionExpression):
+                count += self.countNodes(node.args)
+            elif isinstance(node, (ExecutableAssignment, ExecutableCreation)):
+                count += self.countNodes([node.expression])
+            elif isinstance(node, ExecutableLoop):
+                count += self.countNodes([node.condition, *node.executable_sequence.expressions])
+        return count
+
+    def canInline(self, call):
+        if call.name not in self.functions.keys() or call.name in self.recursive:
+            return False
+        callee = self.functions[call.name]
+        return len(call.args) == callee.param_count and call.delayed_args is None and self.countNodes(callee.executable_sequence.expressions) <= self.size
+
+    # caller is the function the statements are in, None for the top level (where there's no frame to paste into)
+    def inlineBody(self, caller, statements):
+        output = []
+        for statement in statements:
+            if isinstance(statement, FunctionDefenition):
+                pass
+            elif isinstance(statement, ExecutableLoop):
+                statement.condition = self.inlineExpression(statement.condition)
+                # a pasted function counts on its variables starting out fresh, going around the loop again they wouldn't be
+                statement.executable_sequence.expressions = self.inlineBody(None, statement.executable_sequence.expressions)
+            elif isinstance(statement, FunctionExpression):
+                if caller is not None and self.canInline(statement):
+                    output.extend(self.pasteCall(caller, statement, None))
+                    continue
+                statement = self.inlineExpression(statement)
+                if not isinstance(statement, Executable):
+                    # it got pasted in as a constant or variable, which doesn't do anything on its own
+                    continue
+            elif caller is not None and isinstance(statement.expression, FunctionExpression) and self.canInline(statement.expression):
+                output.extend(self.pasteCall(caller, statement.expression, statement))
+                continue
+            else:
+                statement.expression = self.inlineExpression(statement.expression)
+            output.append(statement)
+        return output
+
+    # gives back the statements that replace the call, target is the assignment/creation the call was the right side of
+    def pasteCall(self, caller, call, target):
+        callee = self.functions[call.name]
+        self.inlined_count += 1
+        prefix = f"{callee.name}.{self.inlined_count}."
+        for name in callee.slots.keys():
+            caller.addInlinedSlot(prefix + name, callee.type_scope[name])
+        rename = lambda variable: self.localVariable(caller, prefix + variable.name, variable.position)
+
+        statements = []
+        for param, arg in zip(callee.params.keys(), call.args):
+            statements.append(self.localCreation(caller, callee.type_scope[param], prefix + param, self.inlineExpression(arg)))
+        for statement in callee.executable_sequence.expressions:
+            statements.append(self.copyStatement(caller, statement, prefix, rename))
+
+        if target is not None:
+            if callee.return_slot is None:
+                # functions without a returno/returna give back 0.0
+                target.expression = PrimitiveExpression(0.0, PrimitiveType.NUM, callee.gender)
+                target.expression.position = call.position
+            else:
+                name = "returno" if "returno" in callee.slots.keys() else "returna"
+                target.expression = self.localVariable(caller, prefix + name, call.position)
+            statements.append(target)
+        return statements
+
+    def inlineExpression(self, expression):
+        if not isinstance(expression, FunctionExpression) or expression.name in ("c", "type", "meta"):
+            return expression
+        # a delayed arg (--lazy-args) stays exactly as it is, pasting a function in could leave only builtins in it and
+        # then it wouldn't get delayed anymore
+        delayed = expression.delayed_args
+        expression.args = tuple(arg if delayed is not None and delayed[i] else self.inlineExpression(arg) for i, arg in enumerate(expression.args))
+        if not self.canInline(expression):
+            return expression
+        callee = self.functions[expression.name]
+        body = callee.executable_sequence.expressions
+        if len(body) != 1 or not isinstance(body[0], ExecutableCreation) or not body[0].is_local or body[0].slot != callee.return_slot:
+            return expression
+        if not all(self.isTrivial(arg) for arg in expression.args):
+            return expression
+        # type() would see the arg's type instead of the param's and meta() the arg's position instead of the param's
+        if self.mentions(body, "type") or self.mentions(body, "meta"):
+            return expression
+        args = dict(zip(callee.params.keys(), expression.args))
+        if not self.onlyReads(body[0].expression, args.keys()):
+            return expression
+        self.inlined_count += 1
+        return self.copyExpression(body[0].expression, lambda variable: args[variable.name])
+
+    def isTrivial(self, arg):
+        if isinstance(arg, PrimitiveExpression):
+            return True
+        return isinstance(arg, VariableExpression) and (arg.is_local or arg.name in self.constants)
+
+    def mentions(self, nodes, name):
+        for node in nodes:
+            if isinstance(node, FunctionExpression) and (node.name == name or self.mentions(node.args, name)):
+                return True
+            if isinstance(node, (ExecutableAssignment, ExecutableCreation)) and self.mentions([node.expression], name):
+                return True
+            if isinstance(node, ExecutableLoop) and self.mentions([node.condition, *node.executable_sequence.expressions], name):
+                return True
+        return False
+
+    def onlyReads(self, expression, names):
+        if isinstance(expression, VariableExpression):
+            return not expression.is_local or expression.name in names
+        if isinstance(expression, FunctionExpression):
+            return all(self.onlyReads(arg, names) for arg in expression.args)
+        return True
+
+    def copyExpression(self, expression, rename):
+        if isinstance(expression, PrimitiveExpression):
+            return expression
+        if isinstance(expression, VariableExpression):
+            if expression.is_local:
+                return rename(expression)
+            output = VariableExpression(expression.name)
+            output.position = expression.position
+            output.variable_type = expression.variable_type
+            output.slot = expression.slot
+            return output
+        output = FunctionExpression(expression.name, *[self.copyExpression(arg, rename) for arg in expression.args])
+        output.position = expression.position
+        output.definition = expression.definition
+        output.return_type = expression.return_type
+        output.delayed_args = expression.delayed_args
+        return output
+
+    def copyStatement(self, caller, statement, prefix, rename):
+        if isinstance(statement, FunctionExpression):
+            return self.copyExpression(statement, rename)
+        if isinstance(statement, ExecutableLoop):
+            body = [self.copyStatement(caller, inner, prefix, rename) for inner in statement.executable_sequence.expressions]
+            return ExecutableLoop(self.copyExpression(statement.condition, rename), ExecutableSequence(body), statement.gender)
+        expression = self.copyExpression(statement.expression, rename)
+        if isinstance(statement, ExecutableCreation):
+            return self.localCreation(caller, statement.general_type, prefix + statement.name, expression)
+        output = ExecutableAssignment(statement.name, expression)
+        output.variable_type = statement.variable_type
+        output.is_local = statement.is_local
+        output.slot = statement.slot
+        if statement.is_local:
+            output.name = prefix + statement.name
+            output.slot = caller.slots[output.name]
+        return output
+
+    def localVariable(self, caller, name, position):
+        output = VariableExpression(name)
+        output.position = position
+        output.variable_type = caller.type_scope[name]
+        output.is_local = True
+        output.slot = caller.slots[name]
+        return output
+
+    def localCreation(self, caller, general_type, name, expression):
+        output = ExecutableCreation(general_type, name, expression)
+        output.is_local = True
+        output.slot = caller.slots[name]
+        return output
+
+# times every function and builtin (calls, time spent in it not counting what it called, and time until it returned)
+# and remembers the time spent in every chain of calls for collapsed stacks. it only ever sees what got wrapped for it,
+# wrapping happens when a Runtime (or ClosureCompiler) gets made with one, so it costs nothing when it isn't used.
+# tail calls really don't stay on the stack, so they show up as called by whoever called the function that made them
+class Profiler():
+    def __init__(self):
+        # name -> [calls, self time, total time, how many of it are running right now, builtin or not]
+        self.stats = {}
+        # the chain of calls running right now, every entry is [stats, start time, time spent in calls it made, stack name]
+        self.stack = []
+        # "a;b;c" -> self time of c when it was called from b called from a
+        self.stacks = {}
+        self.heaps = {}
+        self.elapsed = 0.0
+
+    def wrap(self, name, run, builtin):
+        stats = self.stats.setdefault(name, [0, 0.0, 0.0, 0, builtin])
+        enter = self.enter
+        leave = self.leave
+        def profiled(*args):
+            entry = enter(name, stats)
+            try:
+                return run(*args)
+            finally:
+                leave(entry)
+        return profiled
+
+    def enter(self, name, stats):
+        entry = [stats, time.perf_counter(), 0.0, self.stack[-1][3] + ";" + name]
+        stats[0] += 1
+        stats[3] += 1
+        self.stack.append(entry)
+        return entry
+
+    def leave(self, entry):
+        now = time.perf_counter()
+        # recursing too hard can skip a leave on the way out, whatever is still above this gets thrown away
+        while self.stack.pop() is not entry:
+            pass
+        stats = entry[0]
+        elapsed = now - entry[1]
+        own = elapsed - entry[2]
+        stats[1] += own
+        stats[3] -= 1
+        if stats[3] == 0:
+            # recursive calls are inside the outermost one, counting them too would count the same time twice
+            stats[2] += elapsed
+        self.stack[-1][2] += elapsed
+        self.stacks[entry[3]] = self.stacks.get(entry[3], 0.0) + own
+
+    def start(self):
+        self.stack = [[None, time.perf_counter(), 0.0, "<main>"]]
+
+    def stop(self):
+        main = self.stack[0]
+        self.elapsed += time.perf_counter() - main[1]
+        self.stacks["<main>"] = self.stacks.get("<main>", 0.0) + self.elapsed - main[2]
+        self.stack = []
+
+    def report(self) -> str:
+        lines = [f"profile: {self.elapsed * 1000:.2f}ms",
+                 f"{'calls':>10} {'self ms':>10} {'total ms':>10}  function"]
+        for name, (calls, own, total, _, builtin) in sorted(self.stats.items(), key=lambda item: -item[1][1]):
+            if calls != 0:
+                lines.append(f"{calls:>10} {own * 1000:>10.2f} {total * 1000:>10.2f}  {name}(){' (builtin)' if builtin else ''}")
+        lines.append(f"{'heap':>10} {'reads':>10} {'writes':>10}")
+        for name, heap in self.heaps.items():
+            lines.append(f"{name:>10} {heap.reads:>10} {heap.writes:>10}")
+        return "\n".join(lines)
+
+    # one "a;b;c microseconds" line per chain of calls, what flamegraph.pl, speedscope and friends read
+    def collapsedStacks(self) -> str:
+        return "".join(f"{stack} {round(own * 1000000)}\n" for stack, own in self.stacks.items() if round(own * 1000000) > 0)
+
+class TailCall():
+    __slots__ = ('function', 'values')
+
+    def __init__(self, function, values):
+        self.function = function
+        self.values = values
+
+# an arg that doesn't get worked out until the function it got passed to reads it (--lazy-args), and then only once.
+# compute(*arguments) works it out, every engine hands it what it needs for that
+class Thunk():
+    __slots__ = ('compute', 'arguments', 'value')
+
+    def __init__(self, compute, arguments):
+        self.compute = compute
+        self.arguments = arguments
+        self.value = None
+
+    def force(self):
+        if self.compute is not None:
+            self.value = self.compute(*self.arguments)
+            # the frame it was worked out in can go now
+            self.compute = self.arguments = None
+        return self.value
+
+# the tree walker's Thunks, expression gets worked out in the frame of the call that delayed it
+def evaluateDelayed(rt, expression, frame):
+    stack = rt.variable_frame_stack
+    stack.append(frame)
+    value = expression.get_value(rt)
+    stack.pop()
+    return value
+
+# remembers what a pure function gave back for the last size different sets of arguments. calls in tail position
+# skip it (they're part of whatever call is already being remembered)
+# (this is one frame on top of the trampoline, the tree walker runs out of python stack fast enough already)
+class FunctionMemo():
+    def __init__(self, size):
+        self.size = size
+        self.results = {}
+        self.hits = 0
+        self.misses = 0
+
+    def call(self, function, values):
+        key = tuple(values)
+        if 0.0 in key or 1.0 in key:
+            # -0.0 == 0.0 and truo == 1.0 so they would share a result, their reprs tell them apart
+            key = (key, tuple(map(repr, key)))
+        results = self.results
+        try:
+            # dicts keep the order things went in, so putting it back at the end keeps the least recently used one first
+            result = results.pop(key)
+            self.hits += 1
+        except (KeyError):
+            self.misses += 1
+            result = trampoline(function, values)
+            if self.size <= 0:
+                return result
+            if len(results) >= self.size:
+                del results[next(iter(results))]
+        results[key] = result
+        return result
+
+# a call in tail position doesn't actually call anything, it hands back a TailCall and the function that is running loops
+# on it here. so loops written as recursion (which is all of them) run in the same python stack no matter how long they go.
+# function is anything with the slot info of a FunctionDefenition and a runFrame (TreeFunction or CompiledFunction)
+def trampoline(function, values):
+    discarded = False
+    while True:
+        if len(values) == function.param_count:
+            # params always get the first slots so the frame is just the values followed by everything else
+            frame = values + function.locals_template
+        else:
+            # only happens with -t, the args that have a param get copied in and the rest are dropped
+            frame = function.frame_template.copy()
+            for slot, value in zip(function.param_slots, values):
+                frame[slot] = value
+        tail = function.runFrame(frame)
+        if type(tail) is TailCall:
+            # the tail call was the last statement, its value gets thrown away and the caller gives back 0.0
+            discarded = True
+        elif function.return_slot is not None and type(frame[function.return_slot]) is TailCall:
+            tail = frame[function.return_slot]
+        elif discarded or function.return_slot is None:
+            return 0.0
+        else:
+            return frame[function.return_slot]
+        function = tail.function
+        values = tail.values
+
+def callFunction(function, values):
+    if function.memo is not None:
+        return function.memo.call(function, values)
+    return trampoline(function, values)
+
+# ranges shorter than this aren't worth sending to other processes
+PARALLEL_MIN_COUNT = 1000
+
+# runs parmapnum. the first time a run needs it, it starts jobs worker processes that each get their own copy of the program
+# (compiled for the same engine) and keep it until the run is over. the range gets cut into a few pieces per worker and
+# the results come back in order. the function is pure so it can't tell which process it's in, which means doing it right
+# here gives the same thing, so that's what happens for short ranges, one job, impure functions (only with -t) or when
+# this already is a worker process (--batch) that isn't allowed to start more
+class ParallelMap():
+    def __init__(self, program, engine, memo_size, jobs, cache_dir=None):
+        self.program = program
+        self.engine = engine
+        self.memo_size = memo_size
+        self.jobs = jobs
+        self.cache_dir = cache_dir
+        self.pool = None
+
+    def map(self, rt, definition, start, count):
+        values = list(rt.num_heap.loadRange(start, count))
+        function = rt.functions[definition.index]
+        if not definition.pure or count < PARALLEL_MIN_COUNT or self.startPool() is None:
+            results = [callFunction(function, [value]) for value in values]
+        else:
+            size = -(-count // (self.jobs * 4))
+            pieces = self.pool.map(runParallelPiece, [(definition.index, values[i:i + size]) for i in range(0, count, size)])
+            results = [result for piece in pieces for result in piece]
+        rt.num_heap.storeRange(start, results)
+
+    def startPool(self):
+        if self.pool is None and self.jobs > 1 and not multiprocessing.current_process().daemon:
+            try:
+                self.pool = multiprocessing.Pool(self.jobs, startParallelWorker, (self.program, self.engine, self.memo_size, self.cache_dir))
+            except (OSError):
+                # no processes for us, it still works, just on one cpu
+                self.jobs = 1
+        return self.pool
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+parallel_runtime = None
+
+def startParallelWorker(program, engine, memo_size, cache_dir):
+    global parallel_runtime
+    # nothing a pure function does can print, but a Runtime needs somewhere to print to
+    parallel_runtime = Runtime(program, MemorySink(), memo_size)
+    if engine != 'tree':
+        startEngine(program, parallel_runtime, engine, cache_dir)
+
+def runParallelPiece(piece):
+    index, values = piece
+    function = parallel_runtime.functions[index]
+    return [callFunction(function, [value]) for value in values]
+
+# this is the other execution engine. instead of walking the tree every time, it walks it once and turns
+# every node into a python closure with everything already looked up (which function gets called, if a variable
+# is local or global, etc.) so running the program is just closures calling closures.
+# every compiled closure takes the current function frame (None at the global level) and returns the value.
+# the closures hold on to the Runtime's globals and heaps, so they get compiled again for every run
+class ClosureCompiler():
+    def __init__(self, program, rt):
+        self.program = program
+        self.rt = rt
+        self.compiled_functions = {}
+
+    def compileProgram(self):
+        for statement in self.program.statements:
+            if isinstance(statement, FunctionDefenition):
+                self.compiled_functions[statement.name] = CompiledFunction(statement, self.rt.memos[statement.index])
+
+        # bodies get filled in after every function exists so functions can call each other in any order
+        for compiled_function in self.compiled_functions.values():
+            compiled_function.runFrame = self.compileBody([self.compileStatement(statement) for statement in compiled_function.definition.executable_sequence.expressions])
+            if self.rt.profiler is not None:
+                compiled_function.runFrame = self.rt.profiler.wrap(compiled_function.definition.name, compiled_function.runFrame, False)
+        # so whatever runs functions straight out of the Runtime (parmapnum) runs the compiled ones
+        self.rt.functions = list(self.compiled_functions.values())
+
+        statements = [self.compileStatement(statement) for statement in self.program.statements if isinstance(statement, Executable)]
+
+        def run():
+            for statement in statements:
+                statement(None)
+        return run
+
+    # runs the statements of a function body in order and gives back what the last one gave back (for tail calls)
+    def compileBody(self, statements):
+        if len(statements) == 0:
+            return lambda frame: None
+        if len(statements) == 1:
+            return statements[0]
+        if len(statements) == 2:
+            [a, b] = statements
+            def run_two(frame):
+                a(frame)
+                return b(frame)
+            return run_two
+        *rest, last = statements
+        def run(frame):
+            for statement in rest:
+                statement(frame)
+            return last(frame)
+        return run
+
+    def compileStatement(self, statement):
+        if isinstance(statement, FunctionExpression):
+            return self.compileExpression(statement)
+        if isinstance(statement, ExecutableLoop):
+            return self.compileLoop(statement)
+        expression = self.compileExpression(statement.expression)
+        slot = statement.slot
+        if statement.is_local:
+            def assign_local(frame):
+                frame[slot] = expression(frame)
+            return assign_local
+        variable_globals = self.rt.variable_globals
+        def assign_global(frame):
+            variable_globals[slot] = expression(frame)
+        return assign_global
+
+    def compileLoop(self, loop):
+        condition = self.compileExpression(loop.condition)
+        body = self.compileBody([self.compileStatement(statement) for statement in loop.executable_sequence.expressions])
+        def run_loop(frame):
+            while condition(frame):
+                body(frame)
+        return run_loop
+
+    def compileExpression(self, expression):
+        if isinstance(expression, PrimitiveExpression):
+            value = expression.value
+            return lambda frame: value
+        if isinstance(expression, LazyVariableExpression):
+            slot = expression.slot
+            def read_lazy(frame):
+                value = frame[slot]
+                if type(value) is Thunk:
+                    value = frame[slot] = value.force()
+                return value
+            return read_lazy
+        if isinstance(expression, VariableExpression):
+            slot = expression.slot
+            if expression.is_local:
+                return lambda frame: frame[slot]
+            variable_globals = self.rt.variable_globals
+            return lambda frame: variable_globals[slot]
+        return self.compileCall(expression)
+
+    def compileCall(self, expression):
+        args = [self.compileExpression(arg) for arg in expression.args]
+        if expression.definition is None:
+            if self.rt.profiler is not None:
+                return self.rt.profiler.wrap(expression.name, self.compileBuiltin(expression, args), True)
+            return self.compileBuiltin(expression, args)
+
+        function = self.compiled_functions[expression.name]
+        if expression.delayed_args is not None:
+            args = [self.compileDelayed(node, arg) if delayed else arg for node, arg, delayed in zip(expression.args, args, expression.delayed_args)]
+        call = trampoline
+        if expression.tail_call:
+            call = TailCall
+        elif function.memo is not None:
+            call = function.memo.call
+        if len(args) == 0:
+            return lambda frame: call(function, [])
+        if len(args) == 1:
+            [a] = args
+            return lambda frame: call(function, [a(frame)])
+        if len(args) == 2:
+            [a, b] = args
+            return lambda frame: call(function, [a(frame), b(frame)])
+        return lambda frame: call(function, [arg(frame) for arg in args])
+
+    # what gets handed over for an arg that gets passed lazily, a param gets handed on as it is (it can be a Thunk already)
+    def compileDelayed(self, expression, compiled):
+        if isinstance(expression, VariableExpression):
+            slot = expression.slot
+            return lambda frame: frame[slot]
+        return lambda frame: Thunk(compiled, (frame,))
+
+    def compileBuiltin(self, expression, args):
+        if expression.name in compiled_builtins.keys():
+            return compiled_builtins[expression.name](self.rt, expression, *args)
+        # builtins without a closure version still work, they just get handed stand-ins for the expressions
+        evaluer = functions_dict_globals[expression.name]
+        rt = self.rt
+        def call_builtin(frame):
+            return evaluer(rt, *[CompiledArgument(arg, node, frame) for arg, node in zip(args, expression.args)])
+        return call_builtin
+
+# the compiled version of a FunctionDefenition, the trampoline runs these the same way it runs the tree walker's
+class CompiledFunction():
+    def __init__(self, definition, memo):
+        self.definition = definition
+        self.frame_template = definition.frame_template
+        self.locals_template = definition.locals_template
+        self.param_slots = definition.param_slots
+        self.param_count = definition.param_count
+        self.return_slot = definition.return_slot
+        self.memo = memo
+        # filled in with the compiled body once every function has been created
+        self.runFrame = None
+
+# looks enough like an Expression for builtins that only call get_value, get_type or look at position
+class CompiledArgument():
+    def __init__(self, closure, expression, frame):
+        self.closure = closure
+        self.expression = expression
+        self.frame = frame
+        self.position = expression.position
+
+    def get_value(self, rt):
+        return self.closure(self.frame)
+
+    def get_type(self) -> GeneralType:
+        return self.expression.get_type()
+
+# the third engine. it writes the whole program out as python source: every function becomes a python function that
+# takes its frame like the compiled ones (so the trampoline and memos work the same) but keeps its variables in python
+# locals, and the builtins that have a python_builtins version are written out as operators right there.
+# the source only depends on the program, so it gets cached (as a module in the cache dir, so python keeps the .pyc
+# for it too) and every run just calls build with that run's Runtime
+class PythonGenerator():
+    def __init__(self, program):
+        self.program = program
+        self.lines = []
+        # the nodes builtins without a python_builtins version get handed (wrapped in a GeneratedArgument). the source
+        # finds them by where they are in here, which doesn't need the source, so a cached module can go without it
+        self.nodes = [node for statement in program.statements for node in walkNodes(statement)]
+        self.node_indexes = None
+        # the functions that work out delayed args (--lazy-args), they go at the end of build
+        self.thunks = []
+
+    def generateSource(self) -> str:
+        self.lines = [
+            f"# generated by litthewlang {VERSION}, don't edit it. it gets made again whenever the program or the interpreter change",
+            "def build(rt, functions, memos, nodes, lib):",
+            "    TailCall = lib.TailCall",
+            "    Thunk = lib.Thunk",
+            "    trampoline = lib.trampoline",
+            "    concatStrings = lib.concatStrings",
+            "    materialize = lib.materialize",
+            "    heapSub = lib.heapSub",
+            "    heapGet = lib.heapGet",
+            "    GeneratedArgument = lib.GeneratedArgument",
+            "    builtins = rt.builtins",
+            "    write_line = rt.output.writeLine",
+            "    num_heap = rt.num_heap",
+            "    string_heap = rt.string_heap",
+            "    bool_heap = rt.bool_heap",
+            "    G = rt.variable_globals",
+        ]
+        for function in self.program.functions.values():
+            index = function.index
+            self.lines.append(f"    f{index} = functions[{index}]")
+            self.lines.append(f"    call{index} = memos[{index}].call if memos[{index}] is not None else trampoline")
+        for function in self.program.functions.values():
+            self.generateFunction(function)
+        self.lines.append("    def main():")
+        statements = [statement for statement in self.program.statements if isinstance(statement, Executable)]
+        self.generateBody(statements, 2)
+        self.lines.extend(self.thunks)
+        self.lines.append("    return main")
+        return "\n".join(self.lines) + "\n"
+
+    def generateFunction(self, function):
+        self.lines.append(f"    def run{function.index}(frame):")
+        slots = len(function.frame_template)
+        if slots != 0:
+            self.lines.append("        " + "".join(f"l{slot}, " for slot in range(slots)) + "= frame")
+        statements = function.executable_sequence.expressions
+        if function.return_slot is None:
+            # the trampoline only looks at what the last statement gave back (in case it's a tail call)
+            for statement in statements[:-1]:
+                self.generateStatement(statement, 2)
+            if len(statements) != 0 and isinstance(statements[-1], FunctionExpression):
+                self.lines.append(f"        return {self.generateExpression(statements[-1])}")
+            else:
+                self.generateBody(statements[-1:], 2)
+        else:
+            self.generateBody(statements, 2)
+            # the trampoline reads the return value (or the TailCall that'll give it) out of the frame
+            self.lines.append(f"        frame[{function.return_slot}] = l{function.return_slot}")
+        self.lines.append(f"    f{function.index}.runFrame = run{function.index}")
+
+    def generateBody(self, statements, depth):
+        before = len(self.lines)
+        for statement in statements:
+            self.generateStatement(statement, depth)
+        if len(self.lines) == before:
+            self.lines.append("    " * depth + "pass")
+
+    def generateStatement(self, statement, depth):
+        indent = "    " * depth
+        if isinstance(statement, FunctionExpression):
+            if statement.name == "print" and len(statement.args) == 1:
+                # its 0 isn't going anywhere
+                self.lines.append(f"{indent}write_line(str({self.generateExpression(statement.args[0])}))")
+            else:
+                self.lines.append(indent + self.generateExpression(statement))
+        elif isinstance(statement, ExecutableLoop):
+            self.lines.append(f"{indent}while {self.generateExpression(statement.condition)}:")
+            self.generateBody(statement.executable_sequence.expressions, depth + 1)
+        else:
+            self.lines.append(f"{indent}{self.variable(statement.is_local, statement.slot)} = {self.generateExpression(statement.expression)}")
+
+    def variable(self, is_local, slot):
+        return f"l{slot}" if is_local else f"G[{slot}]"
+
+    def generateExpression(self, expression) -> str:
+        if isinstance(expression, PrimitiveExpression):
+            return self.constant(expression.value)
+        if isinstance(expression, LazyVariableExpression):
+            # the first read works it out and keeps the value in the local
+            local = f"l{expression.slot}"
+            return f"({local} if type({local}) is not Thunk else ({local} := {local}.force()))"
+        if isinstance(expression, VariableExpression):
+            return self.variable(expression.is_local, expression.slot)
+        if expression.definition is not None:
+            index = expression.definition.index
+            if expression.delayed_args is None:
+                args = ", ".join(self.generateExpression(arg) for arg in expression.args)
+            else:
+                args = ", ".join(self.generateDelayed(arg) if delayed else self.generateExpression(arg) for arg, delayed in zip(expression.args, expression.delayed_args))
+            if expression.tail_call:
+                return f"TailCall(f{index}, [{args}])"
+            return f"call{index}(f{index}, [{args}])"
+        # types and positions never change at runtime so these are worked out now (c and type don't run their argument)
+        if expression.name == "c" and len(expression.args) == 1:
+            return "0.0"
+        if expression.name == "type" and len(expression.args) == 1:
+            return self.constant(expression.args[0].get_type().pretty())
+        if expression.name == "meta" and len(expression.args) == 1:
+            return self.constant(self.program.contextualize(expression.args[0].position))
+        template = python_builtins.get(expression.name)
+        if template is not None and template.count("{") == len(expression.args):
+            return template.format(*[self.generateExpression(arg) for arg in expression.args])
+        # every other builtin gets what it would have gotten from the tree walker (the ones left all run every argument in order)
+        if self.node_indexes is None:
+            self.node_indexes = {id(node): index for index, node in enumerate(self.nodes)}
+        args = []
+        for arg in expression.args:
+            args.append(f"GeneratedArgument({self.generateExpression(arg)}, nodes[{self.node_indexes[id(arg)]}])")
+        return f"builtins[{expression.name!r}](rt, {', '.join(args)})"
+
+    # a param gets handed on as it is, anything else gets its own function that takes the locals it reads
+    def generateDelayed(self, expression) -> str:
+        if isinstance(expression, VariableExpression):
+            return f"l{expression.slot}"
+        slots = sorted({node.slot for node in walkNodes(expression) if isinstance(node, VariableExpression) and node.is_local})
+        locals_list = ", ".join(f"l{slot}" for slot in slots)
+        body = self.generateExpression(expression)
+        name = f"t{len(self.thunks) // 2}"
+        self.thunks.append(f"    def {name}({locals_list}):")
+        self.thunks.append(f"        return {body}")
+        return f"Thunk({name}, ({locals_list}{',' if len(slots) == 1 else ''}))"
+
+    def constant(self, value) -> str:
+        if type(value) is float and not math.isfinite(value):
+            return f"float({str(value)!r})"
+        return repr(value)
+
+# what a builtin gets handed in a generated program, the value's already worked out
+class GeneratedArgument():
+    __slots__ = ('value', 'expression', 'position')
+
+    def __init__(self, value, expression):
+        self.value = value
+        self.expression = expression
+        self.position = expression.position
+
+    def get_value(self, rt):
+        return self.value
+
+    def get_type(self) -> GeneralType:
+        return self.expression.get_type()
+
+def addSimpleExecutableFunctionDefinition(name: str, evaluer: Any, params: dict, pure: bool = False):
     assert name not in functions_dict_globals.keys()
     functions_dict_globals[name] = evaluer
     functions_dict_globals_types[name] = params[-1]
     functions_dict_globals_types_params[name] = params[:-1]
+    if pure:
+        functions_pure_builtins.add(name)
+
+# the compiled program cache. a checked Program gets pickled under a key made from everything that could change what
+# checking it gives you, so the next run of the same file can skip the grammar, the parse and all the passes
+def cacheKey(source, grammar, interpreter, options):
+    key = hashlib.sha256()
+    # __name__ is in there because pickles made by the script (__main__) don't load when this is imported and the other way around
+    for part in [source.encode(), grammar.encode(), VERSION.encode(), interpreter, repr((__name__, options)).encode()]:
+        key.update(hashlib.sha256(part).digest())
+    return key.hexdigest()
+
+def cachePath(cache_dir, key):
+    return os.path.join(cache_dir, key + ".pickle")
+
+# loading a pickle (or importing a generated module) runs whatever is in it, so only files nobody but this user could
+# have put there get loaded: the file and every folder given have to be theirs and not writable by anybody else
+def isTrustedCacheFile(path, *folders):
+    if not hasattr(os, "getuid"):
+        # windows, there's no owner to check
+        return True
+    try:
+        for checked in (path, os.path.dirname(path), *folders):
+            info = os.stat(checked)
+            if info.st_uid != os.getuid() or info.st_mode & 0o022:
+                return False
+    except (OSError):
+        return False
+    return True
+
+def loadCachedProgram(cache_dir, key):
+    if not isTrustedCacheFile(cachePath(cache_dir, key)):
+        # missing or somebody else's, either way it gets checked again (and the cache gets left alone)
+        return None
+    try:
+        with open(cachePath(cache_dir, key), 'rb') as f:
+            return pickle.load(f)
+    except Exception:
+        # missing, half written or from some other version, either way just check the program again
+        return None
 
-output_program = to_code(parse(content))
+def storeCachedProgram(cache_dir, key, program):
+    try:
+        os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+        temp_path = f"{cachePath(cache_dir, key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as f:
+            pickle.dump(program, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, cachePath(cache_dir, key))
+    except (OSError, RecursionError, pickle.PicklingError):
+        # a cache that can't be written is just a slower run
+        pass
+
+def clearCache(cache_dir):
+    if not os.path.isdir(cache_dir):
+        return
+    for name in os.listdir(cache_dir):
+        if name.endswith(".pickle") or name.endswith(".tmp") or (name.startswith("litthew_") and name.endswith(".py")):
+            os.remove(os.path.join(cache_dir, name))
+    # python's own .pyc files for the generated modules
+    pycache = os.path.join(cache_dir, "__pycache__")
+    if os.path.isdir(pycache):
+        for name in os.listdir(pycache):
+            if name.startswith("litthew_"):
+                os.remove(os.path.join(pycache, name))
+
+# gives back the build function out of the source generator makes, with a cache_dir it goes through a module file there
+# (named after the program's cache key) so the source only gets generated the first time, python only compiles it once
+# and loads the .pyc after that
+def loadPythonSource(generator, cache_dir):
+    source = None
+    if cache_dir is not None and generator.program.cache_key is not None:
+        name = "litthew_" + generator.program.cache_key
+        path = os.path.join(cache_dir, name + ".py")
+        pycache = os.path.join(cache_dir, "__pycache__")
+        try:
+            if not os.path.exists(path):
+                source = generator.generateSource()
+                os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+                temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(temp_path, 'w') as f:
+                    f.write(source)
+                os.replace(temp_path, path)
+            # python loads the .pyc next to it without asking, that has to be just as safe
+            if not isTrustedCacheFile(path, *([pycache] if os.path.isdir(pycache) else [])):
+                raise PermissionError(path)
+            spec = importlib.util.spec_from_file_location(name, path)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            return module.build
+        except (OSError):
+            # a cache that can't be written (or can't be trusted) is just a slower run
+            pass
+    if source is None:
+        source = generator.generateSource()
+    namespace = {}
+    exec(compile(source, "<litthewlang program>", "exec"), namespace)
+    return namespace["build"]
 
 #number functions
 addSimpleExecutableFunctionDefinition("add", 
-                                      lambda x, y: x.get_value() + y.get_value(), 
-                                      [GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE)])
-addSimpleExecutableFunctionDefinition("div", lambda x, y: x.get_value() / y.get_value(),
-                                      [GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE)])
-addSimpleExecutableFunctionDefinition("mul", lambda x, y: x.get_value() * y.get_value(), 
-                                      [GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE)])
-addSimpleExecutableFunctionDefinition("sub", lambda x, y: x.get_value() - y.get_value(), 
-                                      [GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE)])
-addSimpleExecutableFunctionDefinition("mod", lambda x, y: x.get_value() / y.get_value(), 
-                                      [GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE)])
-addSimpleExecutableFunctionDefinition("numtostr", lambda x: str(x.get_value()), [GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.STR, GenderType.MALE)])
+                                      lambda rt, x, y: x.get_value(rt) + y.get_value(rt), 
+                                      [GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE)], pure=True)
+addSimpleExecutableFunctionDefinition("div", lambda rt, x, y: x.get_value(rt) / y.get_value(rt),
+                                      [GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE)], pure=True)
+addSimpleExecutableFunctionDefinition("mul", lambda rt, x, y: x.get_value(rt) * y.get_value(rt), 
+                                      [GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE)], pure=True)
+addSimpleExecutableFunctionDefinition("sub", lambda rt, x, y: x.get_value(rt) - y.get_value(rt), 
+                                      [GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE)], pure=True)
+addSimpleExecutableFunctionDefinition("mod", lambda rt, x, y: x.get_value(rt) / y.get_value(rt), 
+                                      [GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE)], pure=True)
+addSimpleExecutableFunctionDefinition("numtostr", lambda rt, x: str(x.get_value(rt)), [GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.STR, GenderType.MALE)], pure=True)
 
-addSimpleExecutableFunctionDefinition("eqnum", lambda x, y: x.get_value() == y.get_value(), [GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.BOOL, GenderType.MALE)])
+addSimpleExecutableFunctionDefinition("eqnum", lambda rt, x, y: x.get_value(rt) == y.get_value(rt), [GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.BOOL, GenderType.MALE)], pure=True)
 
-addSimpleExecutableFunctionDefinition("lt", lambda x, y: x.get_value() < y.get_value(), [GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.BOOL, GenderType.MALE)])
+addSimpleExecutableFunctionDefinition("lt", lambda rt, x, y: x.get_value(rt) < y.get_value(rt), [GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.BOOL, GenderType.MALE)], pure=True)
 
-addSimpleExecutableFunctionDefinition("gt", lambda x, y: x.get_value() > y.get_value(), [GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.BOOL, GenderType.MALE)])
+addSimpleExecutableFunctionDefinition("gt", lambda rt, x, y: x.get_value(rt) > y.get_value(rt), [GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.BOOL, GenderType.MALE)], pure=True)
 
 #string functions
-addSimpleExecutableFunctionDefinition("concat", lambda x, y: x.get_value() + y.get_value(), [GeneralType(PrimitiveType.STR, GenderType.MALE), GeneralType(PrimitiveType.STR, GenderType.MALE), GeneralType(PrimitiveType.STR, GenderType.MALE)])
-def printso(x):
-    print(x.get_value())
+addSimpleExecutableFunctionDefinition("concat", lambda rt, x, y: concatStrings(x.get_value(rt), y.get_value(rt)), [GeneralType(PrimitiveType.STR, GenderType.MALE), GeneralType(PrimitiveType.STR, GenderType.MALE), GeneralType(PrimitiveType.STR, GenderType.MALE)], pure=True)
+def printso(rt, x):
+    rt.output.writeLine(str(x.get_value(rt)))
     return 0
 addSimpleExecutableFunctionDefinition("print", printso, [GeneralType(PrimitiveType.STR, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE)])
 
-addSimpleExecutableFunctionDefinition("eqstr", lambda x, y: x.get_value() == y.get_value(), [GeneralType(PrimitiveType.STR, GenderType.MALE), GeneralType(PrimitiveType.STR, GenderType.MALE), GeneralType(PrimitiveType.BOOL, GenderType.MALE)])
+addSimpleExecutableFunctionDefinition("eqstr", lambda rt, x, y: materialize(x.get_value(rt)) == materialize(y.get_value(rt)), [GeneralType(PrimitiveType.STR, GenderType.MALE), GeneralType(PrimitiveType.STR, GenderType.MALE), GeneralType(PrimitiveType.BOOL, GenderType.MALE)], pure=True)
 
 #boolean functions
-addSimpleExecutableFunctionDefinition("booltostr", lambda x: "truo" if x.get_value() else "falso", [GeneralType(PrimitiveType.BOOL, GenderType.MALE), GeneralType(PrimitiveType.STR, GenderType.MALE)])
+addSimpleExecutableFunctionDefinition("booltostr", lambda rt, x: "truo" if x.get_value(rt) else "falso", [GeneralType(PrimitiveType.BOOL, GenderType.MALE), GeneralType(PrimitiveType.STR, GenderType.MALE)], pure=True)
 
-addSimpleExecutableFunctionDefinition("eqbool", lambda x, y: x.get_value() == y.get_value(), [GeneralType(PrimitiveType.BOOL, GenderType.MALE), GeneralType(PrimitiveType.BOOL, GenderType.MALE), GeneralType(PrimitiveType.BOOL, GenderType.MALE)])
+addSimpleExecutableFunctionDefinition("eqbool", lambda rt, x, y: x.get_value(rt) == y.get_value(rt), [GeneralType(PrimitiveType.BOOL, GenderType.MALE), GeneralType(PrimitiveType.BOOL, GenderType.MALE), GeneralType(PrimitiveType.BOOL, GenderType.MALE)], pure=True)
 
-addSimpleExecutableFunctionDefinition("not", lambda x: not x.get_value(), [GeneralType(PrimitiveType.BOOL, GenderType.MALE), GeneralType(PrimitiveType.BOOL, GenderType.MALE)])
+addSimpleExecutableFunctionDefinition("not", lambda rt, x: not x.get_value(rt), [GeneralType(PrimitiveType.BOOL, GenderType.MALE), GeneralType(PrimitiveType.BOOL, GenderType.MALE)], pure=True)
 
 #if statements (this is lazy)
-addSimpleExecutableFunctionDefinition("lazyif",  lambda x, y, z: y.get_value() if x.get_value() else z.get_value(), [GeneralType(PrimitiveType.BOOL, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE)])
+addSimpleExecutableFunctionDefinition("lazyif",  lambda rt, x, y, z: y.get_value(rt) if x.get_value(rt) else z.get_value(rt), [GeneralType(PrimitiveType.BOOL, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE)], pure=True)
 
-addSimpleExecutableFunctionDefinition("c", lambda x: 0.0, [GeneralType(PrimitiveType.STR, GenderType.MALE, True) , GeneralType(PrimitiveType.NUM, GenderType.MALE)])
+addSimpleExecutableFunctionDefinition("c", lambda rt, x: 0.0, [GeneralType(PrimitiveType.STR, GenderType.MALE, True) , GeneralType(PrimitiveType.NUM, GenderType.MALE)], pure=True)
 
 # heaps (dictionary and string substitute)
+# ropes never go in the heaps, they're only ropes until somebody looks
 def heapSub(heap, x, y):
-    heap[x] = y
+    heap.store(materialize(x), materialize(y))
     return 0
 
-def heapGet(heap, x):
+def heapGet(rt, heap, x):
     try:
-        return heap[x]
+        return heap.load(materialize(x))
     except (KeyError):
-        print("Heap Access Error: You used a variable on the heap that doesn't exist. Womp to the womp.")
-addSimpleExecutableFunctionDefinition("addnum",  lambda x, y: heapSub(num_heap, x.get_value(), y.get_value()), [GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE)])
-addSimpleExecutableFunctionDefinition("getnum",  lambda x: heapGet(num_heap,x.get_value()), [GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE)])
-
-addSimpleExecutableFunctionDefinition("addstr",  lambda x, y: heapSub(string_heap, x.get_value(), y.get_value()), [GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.STR, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE)])
-addSimpleExecutableFunctionDefinition("getstr",  lambda x: heapGet(string_heap, x.get_value()), [GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.STR, GenderType.MALE)])
-
-addSimpleExecutableFunctionDefinition("addbool",  lambda x, y: heapSub(bool_heap, x.get_value(), y.get_value()), [GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.BOOL, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE)])
-addSimpleExecutableFunctionDefinition("getbool",  lambda x: heapGet(string_heap, x.get_value()), [GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.STR, GenderType.MALE)])
-
-#typing
-addSimpleExecutableFunctionDefinition("type", lambda x: x.get_type().pretty(), [GeneralType(PrimitiveType.NUM, GenderType.MALE, True), GeneralType(PrimitiveType.STR, GenderType.MALE)])
-
-#meta
-addSimpleExecutableFunctionDefinition("meta", lambda x: contextualizeErrorFromMeta(x.meta), [GeneralType(PrimitiveType.NUM, GenderType.MALE, True), GeneralType(PrimitiveType.STR, GenderType.MALE)])
-# Post-Processsing Steps:
-# * Run Through Semantic Name Checking (gender) for Creations and Function Definitions ~ TYPE CHECKING
-# * Ensure Gender Equality ~ TYPE CHECKING
+        rt.output.writeLine("Heap Access Error: You used a variable on the heap that doesn't exist. Womp to the womp.")
+addSimpleExecutableFunctionDefinition("addnum",  lambda rt, x, y: heapSub(rt.num_heap, x.get_value(rt), y.get_value(rt)), [GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE)])
+addSimpleExecutableFunctionDefinition("getnum",  lambda rt, x: heapGet(rt, rt.num_heap,x.get_value(rt)), [GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE)])
+
+addSimpleExecutableFunctionDefinition("addstr",  lambda rt, x, y: heapSub(rt.string_heap, x.get_value(rt), y.get_value(rt)), [GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.STR, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE)])
+addSimpleExecutableFunctionDefinition("getstr",  lambda rt, x: heapGet(rt, rt.string_heap, x.get_value(rt)), [GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.STR, GenderType.MALE)])
+
+addSimpleExecutableFunctionDefinition("addbool",  lambda rt, x, y: heapSub(rt.bool_heap, x.get_value(rt), y.get_value(rt)), [GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.BOOL, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE)])
+addSimpleExecutableFunctionDefinition("getbool",  lambda rt, x: heapGet(rt, rt.bool_heap, x.get_value(rt)), [GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.BOOL, GenderType.MALE)])
+
+# bulk heap functions, these do a whole range of the num heap (count entries starting at start) in one call
+# more than this in one call is way more than the heap will ever hold (the array would be half a gigabyte), ranges that
+# big only ever end up going key by key through the dict, which takes forever and all of your memory
+MAX_BULK_COUNT = 1 << 26
+
+def heapBulk(rt, operation, start, count, *args):
+    # (only with -t can they be something other than a num)
+    if not isinstance(count, (int, float)) or not math.isfinite(count) or count != int(count) or count < 0:
+        rt.output.writeLine(f"Heap Range Error: You asked for {count} entries of the heap. That's not a number of entries. Womp to the womp.")
+        return None
+    if count > MAX_BULK_COUNT:
+        rt.output.writeLine(f"Heap Range Error: You asked for {count} entries of the heap. That's more than the {MAX_BULK_COUNT} you can do at once. Womp to the womp.")
+        return None
+    if isinstance(start, (int, float)) and not math.isfinite(start):
+        rt.output.writeLine(f"Heap Range Error: You asked for entries starting at {start}. There's nothing after that. Womp to the womp.")
+        return None
+    try:
+        output = operation(start, int(count), *args)
+    except (KeyError):
+        rt.output.writeLine("Heap Access Error: You used a variable on the heap that doesn't exist. Womp to the womp.")
+        return None
+    if output is None:
+        return 0
+    return output
 
+# source and count first like every other bulk function, then where it goes
+def copynum(rt, source, count, destination):
+    source = source.get_value(rt)
+    count = count.get_value(rt)
+    return heapBulk(rt, rt.num_heap.copy, source, count, destination.get_value(rt))
 
-# * Run Through Name Checking for All Variables (Check that it exists in a scope) ~ SCOPE CHECKING
-# * Run Through Name Checking for All Functions (Check that it exists) ~ SCOPE CHECKING
+addSimpleExecutableFunctionDefinition("fillnum", lambda rt, x, y, z: heapBulk(rt, rt.num_heap.fill, x.get_value(rt), y.get_value(rt), z.get_value(rt)), [GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE)])
+addSimpleExecutableFunctionDefinition("copynum", copynum, [GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE)])
 
+addSimpleExecutableFunctionDefinition("sumnum", lambda rt, x, y: heapBulk(rt, rt.num_heap.reduce, x.get_value(rt), y.get_value(rt), "sum"), [GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE)])
+addSimpleExecutableFunctionDefinition("minnum", lambda rt, x, y: heapBulk(rt, rt.num_heap.reduce, x.get_value(rt), y.get_value(rt), "min"), [GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE)])
+addSimpleExecutableFunctionDefinition("maxnum", lambda rt, x, y: heapBulk(rt, rt.num_heap.reduce, x.get_value(rt), y.get_value(rt), "max"), [GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE)])
 
-# * Fill in Global Variable Definitions ~ CODE EXECUTION
-# * Fill in Variable Types for All Global Creations (ensure name uniqueness) ~ TYPE CHECKING
-output_program.fillVariableExecutionDefinitions()
+addSimpleExecutableFunctionDefinition("addeachnum", lambda rt, x, y, z: heapBulk(rt, rt.num_heap.map, x.get_value(rt), y.get_value(rt), "+", z.get_value(rt)), [GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE)])
+addSimpleExecutableFunctionDefinition("subeachnum", lambda rt, x, y, z: heapBulk(rt, rt.num_heap.map, x.get_value(rt), y.get_value(rt), "-", z.get_value(rt)), [GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE)])
+addSimpleExecutableFunctionDefinition("muleachnum", lambda rt, x, y, z: heapBulk(rt, rt.num_heap.map, x.get_value(rt), y.get_value(rt), "*", z.get_value(rt)), [GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE)])
+addSimpleExecutableFunctionDefinition("diveachnum", lambda rt, x, y, z: heapBulk(rt, rt.num_heap.map, x.get_value(rt), y.get_value(rt), "/", z.get_value(rt)), [GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE)])
 
-# * Fill in Scoped Variable Definitions ~ CODE EXECUTION
-# * Fill in Variable Types for All Scoped Function Creations and Parameters (ensure name uniqueness) ~ TYPE CHECKING
-output_program.fillVariableScopedExecutionDefinitions()
+addSimpleExecutableFunctionDefinition("sortnum", lambda rt, x, y: heapBulk(rt, rt.num_heap.sort, x.get_value(rt), y.get_value(rt)), [GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE)])
 
-# * Fill in Function Execution Definitions ~ CODE EXECUTION
-# * Fill in Function Types ~ TYPE CHECKING
-output_program.fillFunctionExecutionDefinitions()
+# files to and from the heaps, these give back how many entries they read or wrote
+def heapFile(rt, path, operation, *args):
+    try:
+        return operation(*args)
+    except (OSError) as e:
+        rt.output.writeLine(f"Heap File Error: You tried to use the file {path}, but {(e.strerror or str(e)).lower()}. Womp to the womp.")
+    except (ValueError) as e:
+        rt.output.writeLine(f"Heap File Error: You tried to load the file {path}, but {e}. Womp to the womp.")
+    return None
+
+def loadHeapFile(rt, operation, path, start):
+    path = materialize(path.get_value(rt))
+    return heapFile(rt, path, operation, path, start.get_value(rt))
+
+def saveHeapFile(rt, heap, path, start, count):
+    path = materialize(path.get_value(rt))
+    return heapFile(rt, path, heapBulk, rt, heap.saveFile, start.get_value(rt), count.get_value(rt), path)
+
+addSimpleExecutableFunctionDefinition("mapnum", lambda rt, x, y: loadHeapFile(rt, rt.num_heap.mapFile, x, y), [GeneralType(PrimitiveType.STR, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE)])
+addSimpleExecutableFunctionDefinition("loadnum", lambda rt, x, y: loadHeapFile(rt, rt.num_heap.loadFile, x, y), [GeneralType(PrimitiveType.STR, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE)])
+addSimpleExecutableFunctionDefinition("loadstr", lambda rt, x, y: loadHeapFile(rt, rt.string_heap.loadFile, x, y), [GeneralType(PrimitiveType.STR, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE)])
+addSimpleExecutableFunctionDefinition("savenum", lambda rt, x, y, z: saveHeapFile(rt, rt.num_heap, x, y, z), [GeneralType(PrimitiveType.STR, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE)])
+addSimpleExecutableFunctionDefinition("savestr", lambda rt, x, y, z: saveHeapFile(rt, rt.string_heap, x, y, z), [GeneralType(PrimitiveType.STR, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE)])
+
+def parmapnum(rt, name, start, count):
+    name = materialize(name.get_value(rt))
+    definition = rt.program.functions.get(name)
+    if definition is None:
+        # only gets past the type checker with -t
+        rt.output.writeLine(f"Parallel Error: You tried to run <{name}()> on a bunch of cpus, but it doesn't exist on any of them. Womp to the womp.")
+        return None
+    return heapBulk(rt, lambda start, count: rt.parallel.map(rt, definition, start, count), start.get_value(rt), count.get_value(rt))
+
+# runs a pure function (given by name) on every entry of a range of the num heap in a bunch of processes at once
+addSimpleExecutableFunctionDefinition("parmapnum", parmapnum, [GeneralType(PrimitiveType.STR, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE), GeneralType(PrimitiveType.NUM, GenderType.MALE)])
 
-# backtrack and let all variable expressions know their type
-output_program.fillVariableExpressionTypes()
+#typing
+addSimpleExecutableFunctionDefinition("type", lambda rt, x: x.get_type().pretty(), [GeneralType(PrimitiveType.NUM, GenderType.MALE, True), GeneralType(PrimitiveType.STR, GenderType.MALE)], pure=True)
 
-if (len(published_errors) != 0):
-    print("\n\n".join(published_errors))
-    exit(1)
+#meta
+addSimpleExecutableFunctionDefinition("meta", lambda rt, x: rt.contextualize(x.position), [GeneralType(PrimitiveType.NUM, GenderType.MALE, True), GeneralType(PrimitiveType.STR, GenderType.MALE)], pure=True)
+
+def compiledPrint(rt, x):
+    write_line = rt.output.writeLine
+    def run(frame):
+        write_line(str(x(frame)))
+        return 0
+    return run
+
+def compiledConstant(value):
+    return lambda frame: value
+
+# closure versions of the builtins above for the compiled engine, these have to behave exactly like the lambdas they copy
+# (yes mod divides, the tree walker does that too)
+# each one gets the Runtime, the FunctionExpression and the already compiled arguments
+compiled_builtins = {
+    "add": lambda rt, e, x, y: lambda frame: x(frame) + y(frame),
+    "div": lambda rt, e, x, y: lambda frame: x(frame) / y(frame),
+    "mul": lambda rt, e, x, y: lambda frame: x(frame) * y(frame),
+    "sub": lambda rt, e, x, y: lambda frame: x(frame) - y(frame),
+    "mod": lambda rt, e, x, y: lambda frame: x(frame) / y(frame),
+    "numtostr": lambda rt, e, x: lambda frame: str(x(frame)),
+    "eqnum": lambda rt, e, x, y: lambda frame: x(frame) == y(frame),
+    "lt": lambda rt, e, x, y: lambda frame: x(frame) < y(frame),
+    "gt": lambda rt, e, x, y: lambda frame: x(frame) > y(frame),
+    "concat": lambda rt, e, x, y: lambda frame: concatStrings(x(frame), y(frame)),
+    "print": lambda rt, e, x: compiledPrint(rt, x),
+    "eqstr": lambda rt, e, x, y: lambda frame: materialize(x(frame)) == materialize(y(frame)),
+    "booltostr": lambda rt, e, x: lambda frame: "truo" if x(frame) else "falso",
+    "eqbool": lambda rt, e, x, y: lambda frame: x(frame) == y(frame),
+    "not": lambda rt, e, x: lambda frame: not x(frame),
+    "lazyif": lambda rt, e, x, y, z: lambda frame: y(frame) if x(frame) else z(frame),
+    "c": lambda rt, e, x: compiledConstant(0.0),
+    "addnum": lambda rt, e, x, y: lambda frame: heapSub(rt.num_heap, x(frame), y(frame)),
+    "getnum": lambda rt, e, x: lambda frame: heapGet(rt, rt.num_heap, x(frame)),
+    "addstr": lambda rt, e, x, y: lambda frame: heapSub(rt.string_heap, x(frame), y(frame)),
+    "getstr": lambda rt, e, x: lambda frame: heapGet(rt, rt.string_heap, x(frame)),
+    "addbool": lambda rt, e, x, y: lambda frame: heapSub(rt.bool_heap, x(frame), y(frame)),
+    "getbool": lambda rt, e, x: lambda frame: heapGet(rt, rt.bool_heap, x(frame)),
+    # types and positions never change at runtime so these are worked out while compiling
+    "type": lambda rt, e, x: compiledConstant(e.args[0].get_type().pretty()),
+    "meta": lambda rt, e, x: compiledConstant(rt.contextualize(e.args[0].position)),
+}
 
-# * Run Type Checking on Functions, Creations, and Assignments (ensure everything is taking the right types) ~ TYPE CHECKING
-if (DO_TYPE_CHECK):
-    output_program.typecheck()
+# what the python engine writes instead of calling the builtin, {0}, {1}... are the arguments (already python source).
+# same deal as compiled_builtins, these have to do exactly what the lambdas up there do and in the same order
+python_builtins = {
+    "add": "({0} + {1})",
+    "div": "({0} / {1})",
+    "mul": "({0} * {1})",
+    "sub": "({0} - {1})",
+    "mod": "({0} / {1})",
+    "numtostr": "str({0})",
+    "eqnum": "({0} == {1})",
+    "lt": "({0} < {1})",
+    "gt": "({0} > {1})",
+    "concat": "concatStrings({0}, {1})",
+    "print": "(write_line(str({0})) or 0)",
+    "eqstr": "(materialize({0}) == materialize({1}))",
+    "booltostr": "('truo' if {0} else 'falso')",
+    "eqbool": "({0} == {1})",
+    "not": "(not {0})",
+    "lazyif": "({1} if {0} else {2})",
+    "addnum": "heapSub(num_heap, {0}, {1})",
+    "getnum": "heapGet(rt, num_heap, {0})",
+    "addstr": "heapSub(string_heap, {0}, {1})",
+    "getstr": "heapGet(rt, string_heap, {0})",
+    "addbool": "heapSub(bool_heap, {0}, {1})",
+    "getbool": "heapGet(rt, bool_heap, {0})",
+}
+# turns source into CompiledPrograms. keep one of these around and the grammar only gets built once for all of them.
+# an Interpreter isn't meant to be shared between threads (lark's parser isn't), but as many as you want can run at once
+class Interpreter():
+    def __init__(self, type_check=True, gender_check=True, fold=True, inline_size=20, cache_dir=None, lazy_args=False, max_errors=None):
+        self.type_check = type_check
+        self.gender_check = gender_check
+        self.fold = fold
+        self.inline_size = inline_size
+        self.lazy_args = lazy_args
+        # only this many errors get shown (the rest only get counted), None shows all of them
+        self.max_errors = max_errors
+        # None means no cache
+        self.cache_dir = cache_dir
+        with open(GRAMMAR_PATH, 'r') as f:
+            self.grammar = f.read()
+        # building the parser is slow so it only happens once something actually needs parsing (not on a cache hit)
+        self.parser = None
+        self.interpreter_source = None
+
+    def buildParser(self):
+        if self.parser is None:
+            self.parser = lark.Lark(self.grammar, propagate_positions=True)
+        return self.parser
+
+    def parse(self, text):
+        return self.buildParser().parse(text)
+
+    def cacheKey(self, source):
+        if self.interpreter_source is None:
+            with open(os.path.abspath(__file__), 'rb') as f:
+                self.interpreter_source = f.read()
+        return cacheKey(source, self.grammar, self.interpreter_source, (self.type_check, self.gender_check, self.fold, self.inline_size, self.lazy_args))
+
+    # timings is a dict that gets how long every phase took added to it (see PhaseClock), for the benchmarks.
+    # on_error gets every error as soon as it's found (see Diagnostics), they all end up in errors either way
+    def compile(self, source, timings=None, on_error=None) -> "CompiledProgram":
+        if self.cache_dir is not None:
+            cache_key = self.cacheKey(source)
+            cached_program = loadCachedProgram(self.cache_dir, cache_key)
+            if cached_program is not None:
+                # everything in check was already done to this program
+                return CompiledProgram(cached_program, self.cache_dir)
+
+        program = self.check(source, timings, on_error)
+
+        # * Save the Checked Program So the Next Run Can Skip All of This ~ CACHING
+        if (len(program.errors) == 0 and self.cache_dir is not None):
+            program.cache_key = cache_key
+            storeCachedProgram(self.cache_dir, cache_key, program)
+        return CompiledProgram(program, self.cache_dir)
+
+    def check(self, source, timings=None, on_error=None) -> Program:
+        clock = PhaseClock(timings)
+        self.buildParser()
+        clock.lap("grammar")
+        tree = self.parse(source)
+        clock.lap("parse")
+        output_program = to_code(tree, source)
+        # nothing points into the parse tree anymore (positions got copied out of it), so it can go now instead of at the end
+        del tree
+        clock.lap("transform")
+
+        output_program.diagnostics.limit = self.max_errors
+        output_program.diagnostics.listener = on_error
+        try:
+            self.checkProgram(output_program, clock)
+        finally:
+            # the program gets pickled (the cache, parmapnum's workers), the listener doesn't have to
+            output_program.diagnostics.listener = None
+        return output_program
+
+    def checkProgram(self, output_program, clock):
+
+        # Post-Processsing Steps:
+        # * Run Through Semantic Name Checking (gender) for Creations and Function Definitions ~ TYPE CHECKING
+        # * Ensure Gender Equality ~ TYPE CHECKING
+
+
+        # * Run Through Name Checking for All Variables (Check that it exists in a scope) ~ SCOPE CHECKING
+        # * Run Through Name Checking for All Functions (Check that it exists) ~ SCOPE CHECKING
+
+
+        # * Fill in Global Variable Definitions ~ CODE EXECUTION
+        # * Fill in Variable Types for All Global Creations (ensure name uniqueness) ~ TYPE CHECKING
+        output_program.fillVariableExecutionDefinitions()
+
+        # * Fill in Scoped Variable Definitions ~ CODE EXECUTION
+        # * Fill in Variable Types for All Scoped Function Creations and Parameters (ensure name uniqueness) ~ TYPE CHECKING
+        output_program.fillVariableScopedExecutionDefinitions()
+
+        # * Fill in Function Execution Definitions ~ CODE EXECUTION
+        # * Fill in Function Types ~ TYPE CHECKING
+        output_program.fillFunctionExecutionDefinitions()
+
+        # backtrack and let all variable expressions know their type
+        output_program.fillVariableExpressionTypes()
+        clock.lap("scope")
+
+        if (len(output_program.errors) != 0):
+            return
 
-#print(output_program)
+        # * Run Type Checking on Functions, Creations, and Assignments (ensure everything is taking the right types) ~ TYPE CHECKING
+        if (self.type_check):
+            output_program.typecheck(self.gender_check)
+        # nothing needs these after type checking
+        output_program.typechecks = []
+        clock.lap("typecheck")
+
+        # * Fold Constant Calls and Drop Code That Can Never Do Anything ~ CODE EXECUTION
+        if (self.fold and len(output_program.errors) == 0):
+            output_program.foldConstants()
+
+        # * Paste Small Functions Into Where They Get Called ~ CODE EXECUTION
+        if (self.inline_size > 0 and len(output_program.errors) == 0):
+            # pasting a call in works out every arg first, so calls that would pass something lazily stay calls
+            if (self.lazy_args):
+                output_program.fillPureFunctions()
+                output_program.fillLazyArguments()
+            # the args that got pasted in can make more stuff constant
+            if (Inliner(output_program, self.inline_size).inlineProgram() != 0 and self.fold):
+                output_program.foldConstants()
+
+        # * Find Functions That Only Depend On Their Arguments So They Can Be Memoized ~ CODE EXECUTION
+        output_program.fillPureFunctions()
+
+        # * Find Calls in Tail Position So They Can Be Trampolined ~ CODE EXECUTION
+        output_program.fillTailCalls()
+
+        # * Find Args That Don't Have to Be Worked Out Unless They Get Used ~ CODE EXECUTION
+        if (self.lazy_args and len(output_program.errors) == 0):
+            output_program.fillLazyArguments()
+        clock.lap("optimize")
+
+# adds how long every phase took to timings (phase name -> seconds), every lap is the time since the last one.
+# with timings None it doesn't keep anything
+class PhaseClock():
+    def __init__(self, timings):
+        self.timings = timings
+        self.last = time.perf_counter()
+
+    def lap(self, phase):
+        now = time.perf_counter()
+        if self.timings is not None:
+            self.timings[phase] = self.timings.get(phase, 0.0) + now - self.last
+        self.last = now
+
+# gets rt ready to run program with the compiled or python engine and gives back what runs the top level
+# (rt.functions ends up being that engine's functions). cache_dir is where the python engine keeps its modules
+def startEngine(program, rt, engine, cache_dir=None):
+    if engine == 'python':
+        try:
+            generator = PythonGenerator(program)
+            build = loadPythonSource(generator, cache_dir)
+        except (RecursionError, SyntaxError, MemoryError):
+            # nested deeper than python is willing to compile, the closures can take it
+            build = None
+        if build is not None:
+            functions = [CompiledFunction(definition, rt.memos[definition.index]) for definition in program.functions.values()]
+            run = build(rt, functions, rt.memos, generator.nodes, sys.modules[__name__])
+            if rt.profiler is not None:
+                for function in functions:
+                    function.runFrame = rt.profiler.wrap(function.definition.name, function.runFrame, False)
+            rt.functions = functions
+            return run
+    return ClosureCompiler(program, rt).compileProgram()
+
+# a checked program, run it as many times as you want. every run starts from scratch (globals, heaps, memos)
+class CompiledProgram():
+    def __init__(self, program, cache_dir=None):
+        self.program = program
+        self.errors = program.errors
+        # where the python engine caches the modules it makes (None keeps them in memory)
+        self.cache_dir = cache_dir
+
+    # output is where print goes, when it's None everything printed gets collected and handed back in the RunResult.
+    # output can also be an OutputSink, a file gets a StreamSink (buffered like --buffering auto) that's flushed when it's done.
+    # memo_size None turns memoizing off
+    # profiler is a Profiler to time the run with, it can be handed to more than one run and adds them up.
+    # timings gets how long compiling (compiled engine only) and executing took added to it like Interpreter.compile.
+    # jobs is how many processes parmapnum can use (None is one per cpu), with a profiler it always stays in this one
+    def run(self, engine='tree', memo_size=1024, output=None, profiler=None, timings=None, jobs=None) -> "RunResult":
+        assert len(self.errors) == 0, "programs with errors can't be run"
+        captured = output is None
+        if captured:
+            output = MemorySink()
+        elif not isinstance(output, OutputSink):
+            output = StreamSink(output)
+        rt = Runtime(self.program, output, memo_size, profiler)
+        if jobs is None:
+            jobs = os.cpu_count() or 1
+        rt.parallel = ParallelMap(self.program, engine, memo_size, jobs if profiler is None else 1, self.cache_dir)
+        if profiler is not None:
+            profiler.start()
+        clock = PhaseClock(timings)
+        try:
+            if (engine != 'tree'):
+                run = startEngine(self.program, rt, engine, self.cache_dir)
+                clock.lap("compile")
+                run()
+            else:
+                self.program.executeProgram(rt)
+        except (RecursionError):
+            output.writeLine("Recursion Error: You recursed too hard. Go to jail.")
+        except (ZeroDivisionError):
+            output.writeLine("Zero Division Error: You divided by zero. Your program was sucked into a black hole.")
+        finally:
+            # whatever the program printed has to come out before anything else does (even a traceback)
+            output.flush()
+            rt.parallel.close()
+        clock.lap("execute")
+        if profiler is not None:
+            profiler.stop()
+        memo_stats = [(function.name, memo.hits, memo.misses) for function, memo in zip(self.program.functions.values(), rt.memos) if memo is not None]
+        return RunResult(output.getvalue() if captured else None, memo_stats)
+
+class RunResult():
+    def __init__(self, output, memo_stats):
+        # everything the program printed (None if it went to an output that was passed in)
+        self.output = output
+        # (function name, hits, misses) for every memoized function
+        self.memo_stats = memo_stats
+
+# splits a file into its top level statements without parsing it, (first line, text) for every one of them.
+# a statement goes on until its brackets close (calls can go over more than one line) and a function or loop goes on until
+# the fino/fina that closes it (loops inside it have their own)
+def splitStatements(source):
+    chunks = []
+    current = []
+    start = 0
+    depth = 0
+    blocks = 0
+    for number, line in enumerate(source.split("\n"), 1):
+        if len(current) == 0 and line.strip() == "":
+            continue
+        if len(current) == 0:
+            start = number
+        current.append(line)
+        words = line.split(None, 1)
+        if len(words) != 0 and words[0] in ("defo", "defa", "whilo", "whila"):
+            blocks += 1
+        elif line.strip() in ("fino", "fina"):
+            blocks -= 1
+        depth = bracketDepth(line, depth)
+        if depth > 0 or blocks > 0:
+            continue
+        blocks = 0
+        chunks.append((start, "\n".join(current)))
+        current = []
+    if len(current) != 0:
+        chunks.append((start, "\n".join(current)))
+    return chunks
+
+def bracketDepth(line, depth):
+    in_string = False
+    escaped = False
+    for character in line:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif character == "\\":
+                escaped = True
+            elif character == '"':
+                in_string = False
+        elif character == '"':
+            in_string = True
+        elif character == "(":
+            depth += 1
+        elif character == ")":
+            depth -= 1
+    return depth
+
+# every node in a statement, the statement included
+def walkNodes(node):
+    yield node
+    if isinstance(node, FunctionDefenition):
+        for statement in node.executable_sequence.expressions:
+            yield from walkNodes(statement)
+    elif isinstance(node, FunctionExpression):
+        for arg in node.args:
+            yield from walkNodes(arg)
+    elif isinstance(node, (ExecutableAssignment, ExecutableCreation)):
+        yield from walkNodes(node.expression)
+    elif isinstance(node, ExecutableLoop):
+        yield from walkNodes(node.condition)
+        for statement in node.executable_sequence.expressions:
+            yield from walkNodes(statement)
+
+# a Program that keeps its errors as (message, position) so they can still be turned into text after the lines moved
+class IncrementalProgram(Program):
+    def publishError(self, message, position):
+        self.errors.append((message, position))
+
+# one top level statement and everything checking it found out, kept between checks until its text changes
+class CheckedStatement():
+    def __init__(self, start, text, statement, typechecks):
+        self.start = start
+        self.text = text
+        self.statement = statement
+        self.typechecks = typechecks
+        # every variable and function name it mentions, if any of them changes type it has to be checked again
+        self.uses = set()
+        self.positioned = []
+        self.calls = []
+        for node in walkNodes(statement):
+            if isinstance(node, (VariableExpression, FunctionExpression, ExecutableAssignment)):
+                self.uses.add(node.name)
+            if isinstance(node, Expression):
+                self.positioned.append(node)
+            if isinstance(node, FunctionExpression):
+                self.calls.append(node)
+        # parmapnum cares whether the function it runs is pure, which can change without any signature changing
+        self.maps_in_parallel = "parmapnum" in self.uses
+        # None until it's been scoped/type checked against the current globals and functions
+        self.scope_errors = None
+        self.type_errors = None
+
+    def moveTo(self, start):
+        shift = packPosition(start - self.start, 0)
+        for node in self.positioned:
+            node.position += shift
+        if self.scope_errors is not None:
+            self.scope_errors = [(message, position + shift) for message, position in self.scope_errors]
+        if self.type_errors is not None:
+            self.type_errors = [(message, position + shift) for message, position in self.type_errors]
+        self.start = start
+
+# checks the same file over and over (for --watch). it remembers every top level statement and only parses the ones whose
+# text changed, then only scopes and type checks those and the ones using a global or function whose type changed.
+# the errors come out exactly like Interpreter.check would give them. the Program in here only gets checked, never run
+class IncrementalChecker():
+    def __init__(self, interpreter):
+        self.interpreter = interpreter
+        self.checked = []
+        self.signatures = {}
+        # how much the last check had to redo
+        self.parsed_count = 0
+        self.rechecked_count = 0
+
+    def reset(self):
+        self.checked = []
+        self.signatures = {}
+
+    def parseStatement(self, start, text):
+        # a newline in front lets it be indented like it could be anywhere but the first line of the file
+        prefix = "" if start == 1 else "\n"
+        program = to_code(self.interpreter.parse(prefix + text), text)
+        if len(program.statements) != 1:
+            return None
+        checked = CheckedStatement(1 + len(prefix), text, program.statements[0], program.typechecks)
+        checked.moveTo(start)
+        return checked
+
+    def check(self, source) -> list:
+        try:
+            return self.checkSource(source)
+        except (Exception):
+            # whatever it was in the middle of can't be trusted anymore
+            self.reset()
+            raise
+
+    def checkSource(self, source) -> list:
+        # * Reuse Every Statement Whose Text Didn't Change, Parse the Rest ~ PARSING
+        previous = {}
+        for checked in self.checked:
+            previous.setdefault(checked.text, []).append(checked)
+        self.checked = []
+        fresh = []
+        for start, text in splitStatements(source):
+            if text in previous.keys() and len(previous[text]) != 0:
+                checked = previous[text].pop(0)
+                if checked.start != start:
+                    checked.moveTo(start)
+            else:
+                try:
+                    checked = self.parseStatement(start, text)
+                except (lark.exceptions.LarkError):
+                    checked = None
+                if checked is None:
+                    # either the statement really is broken or it got split wrong, parsing the whole thing tells which
+                    self.reset()
+                    program = self.interpreter.check(source)
+                    summary = program.diagnostics.summary()
+                    return program.errors + ([summary] if summary is not None else [])
+                fresh.append(checked)
+            self.checked.append(checked)
+        self.parsed_count = len(fresh)
+
+        # * Fill in Globals and Functions (cheap, so it's all of them every time) ~ TYPE CHECKING
+        program = IncrementalProgram([checked.statement for checked in self.checked], [], source)
+        program.gender_check = self.interpreter.gender_check
+        program.fillVariableExecutionDefinitions()
+        # (only after everything parsed and in the same order as Interpreter.check, so it blows up the same way it would)
+        for checked in fresh:
+            if isinstance(checked.statement, FunctionDefenition):
+                checked.statement.fillVariablesScopedExecutionDefinitions()
+        program.fillFunctionExecutionDefinitions()
+
+        # (types are compared by their bits, == lets the types that are always equal match anything)
+        signatures = {}
+        for name, general_type in program.variable_dict_globals_types.items():
+            signatures[name] = general_type.bits
+        for name in program.functions.keys():
+            signatures[name] = (tuple(param.bits for param in program.function_param_types[name]), program.function_types[name].bits)
+        changed = {name for name in signatures.keys() | self.signatures.keys() if signatures.get(name) != self.signatures.get(name)}
+        self.signatures = signatures
+
+        # * Scope Check Whatever Is New or Uses Something That Changed ~ SCOPE CHECKING
+        self.rechecked_count = 0
+        for checked in self.checked:
+            if checked.scope_errors is not None and checked.uses.isdisjoint(changed):
+                continue
+            self.rechecked_count += 1
+            program.errors = []
+            if isinstance(checked.statement, FunctionDefenition):
+                checked.statement.fillOutScope(program)
+            else:
+                checked.statement.setScope(program, program.variable_dict_globals_types)
+            checked.scope_errors = program.errors
+            checked.type_errors = None
+
+        errors = [error for checked in self.checked for error in checked.scope_errors]
+
+        # * Type Check the Same Ones, but Only Once Nothing Is Missing (like Interpreter.check) ~ TYPE CHECKING
+        if (len(errors) == 0 and self.interpreter.type_check):
+            if any(checked.maps_in_parallel for checked in self.checked):
+                # calls that weren't scoped again still point at the function from before it changed
+                for checked in self.checked:
+                    for call in checked.calls:
+                        call.definition = program.functions.get(call.name)
+                program.fillPureFunctions()
+            for checked in self.checked:
+                if checked.type_errors is None or checked.maps_in_parallel:
+                    program.errors = []
+                    for statement in checked.typechecks:
+                        statement.typecheck(program)
+                    checked.type_errors = program.errors
+                errors.extend(checked.type_errors)
+
+        program.errors = [program.diagnostics.format(message, position) for message, position in errors]
+        limit = self.interpreter.max_errors
+        if limit is not None and len(errors) > max(limit, 1):
+            # like Interpreter.check gives them
+            program.diagnostics.limit = limit
+            program.diagnostics.hidden = len(errors) - max(limit, 1)
+            program.errors = program.errors[:max(limit, 1)] + [program.diagnostics.summary()]
+        return program.errors
+
+# keeps checking a file every time it gets saved until ctrl-c
+def watchFile(path, interpreter_options) -> int:
+    checker = IncrementalChecker(Interpreter(**interpreter_options))
+    last_modified = None
+    try:
+        while True:
+            try:
+                modified = os.stat(path).st_mtime_ns
+            except (OSError):
+                modified = None
+            if modified is None or modified == last_modified:
+                time.sleep(0.1)
+                continue
+            last_modified = modified
+            with open(path, 'r') as f:
+                content = f.read()
+
+            start = time.perf_counter()
+            try:
+                errors = checker.check(content)
+            except (lark.exceptions.LarkError) as error:
+                errors = [str(error)]
+            except (Exception):
+                errors = [traceback.format_exc()]
+            elapsed = (time.perf_counter() - start) * 1000
+
+            print("\n\n".join(errors) if len(errors) != 0 else "No errors. Your program is perfect (for now).")
+            print(f"watch: checked {path} in {elapsed:.1f}ms ({checker.parsed_count} of {len(checker.checked)} statements parsed, {checker.rechecked_count} checked), {len(errors)} errors", file=sys.stderr)
+            sys.stdout.flush()
+    except (KeyboardInterrupt):
+        return 0
+
+# batch mode. every worker process makes one Interpreter (and builds the grammar once) and then runs whatever files
+# it gets handed with it. one file blowing up only fails that file
+batch_interpreter = None
+batch_run_options = None
+
+def startBatchWorker(interpreter_options, run_options):
+    global batch_interpreter, batch_run_options
+    batch_interpreter = Interpreter(**interpreter_options)
+    batch_interpreter.buildParser()
+    batch_run_options = run_options
+
+# gives back (path, output, diagnostics, exit status) like running the file by itself would have
+def runBatchFile(path):
+    output = io.StringIO()
+    try:
+        with open(path, 'r') as f:
+            content = f.read()
+        compiled_program = batch_interpreter.compile(content)
+        if (len(compiled_program.errors) != 0):
+            summary = compiled_program.program.diagnostics.summary()
+            errors = compiled_program.errors + ([summary] if summary is not None else [])
+            return path, "", "\n\n".join(errors) + "\n", 1
+        compiled_program.run(output=output, **batch_run_options)
+    except (Exception):
+        return path, output.getvalue(), traceback.format_exc(), 1
+    return path, output.getvalue(), "", 0
+
+def findBatchFiles(paths):
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for folder, _, names in sorted(os.walk(path)):
+                found.extend(os.path.join(folder, name) for name in sorted(names) if name.endswith(".litthew"))
+        else:
+            found.append(path)
+    return found
+
+def runBatch(paths, jobs, interpreter_options, run_options) -> int:
+    files = findBatchFiles(paths)
+    start = time.perf_counter()
+    if jobs <= 1:
+        startBatchWorker(interpreter_options, run_options)
+        results = map(runBatchFile, files)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(jobs, startBatchWorker, (interpreter_options, run_options))
+        # imap hands results back in the order the files were given no matter which worker finishes first
+        results = pool.imap(runBatchFile, files, chunksize=max(1, len(files) // (jobs * 4)))
+
+    failed = 0
+    for path, output, diagnostics, status in results:
+        sys.stdout.write(f"==> {path} (exit {status}) <==\n{output}{diagnostics}\n")
+        sys.stdout.flush()
+        if status != 0:
+            failed += 1
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    elapsed = time.perf_counter() - start
+    print(f"batch: {len(files)} files in {elapsed:.2f}s ({len(files) / max(elapsed, 1e-9):.1f} files/s) with {max(jobs, 1)} worker(s), {failed} failed", file=sys.stderr)
+    return 1 if failed != 0 else 0
+
+def main():
+    arguments = argument_parser.parse_args()
+    if (arguments.filename is None and arguments.batch is None):
+        argument_parser.error("the following arguments are required: filename")
+    if (arguments.debug):
+        enableDebugChecks()
+    if (arguments.clear_cache):
+        clearCache(arguments.cache_dir)
+
+    interpreter_options = {
+        "type_check": not arguments.no_type,
+        "gender_check": not arguments.no_gender,
+        "fold": not arguments.no_fold,
+        "inline_size": arguments.inline_size,
+        "cache_dir": None if arguments.no_cache else arguments.cache_dir,
+        "lazy_args": arguments.lazy_args,
+        "max_errors": arguments.max_errors if arguments.max_errors > 0 else None,
+    }
+    run_options = {
+        "engine": arguments.engine,
+        "memo_size": None if arguments.no_memo else arguments.memo_size,
+        "jobs": arguments.jobs,
+    }
+
+    if (arguments.error_format == 'json' and (arguments.batch is not None or arguments.watch)):
+        argument_parser.error("--error-format json only works when running one file")
+
+    if (arguments.watch):
+        if (arguments.filename is None):
+            argument_parser.error("--watch needs a filename")
+        exit(watchFile(arguments.filename, interpreter_options))
+
+    if (arguments.batch is not None):
+        exit(runBatch(arguments.batch, arguments.jobs, interpreter_options, run_options))
+
+    interpreter = Interpreter(**interpreter_options)
+
+    with open(arguments.filename, 'r') as f:
+        content = f.read()
+
+    # errors go to stderr as soon as they're found, not once checking is done
+    printed = 0
+    def printError(text, details):
+        nonlocal printed
+        if (arguments.error_format == 'json'):
+            print(json.dumps({"kind": "error", "file": arguments.filename, **details}), file=sys.stderr)
+        else:
+            print(text if printed == 0 else "\n" + text, file=sys.stderr)
+        printed += 1
+        sys.stderr.flush()
 
-if (len(published_errors) == 0):
     try:
-        output_program.executeProgram()
-    except (RecursionError):
-        print("Recursion Error: You recursed too hard. Go to jail.")
-    except (ZeroDivisionError):
-        print("Zero Division Error: You divided by zero. Your program was sucked into a black hole.")
-else:
-    print("\n\n".join(published_errors))
-    exit(1)
-
-exit(0)
-
-# print("Program Complete")
-# print(variable_dict_globals)
-# print(num_heap)
+        compiled_program = interpreter.compile(content, on_error=printError)
+    except (lark.exceptions.UnexpectedInput) as error:
+        if (arguments.error_format != 'json'):
+            raise
+        # a syntax error is still an error for whatever reads the json
+        printError(str(error), {"line": error.line, "column": error.column, "message": str(error).strip(), "source": Diagnostics(content).line(error.line)})
+        print(json.dumps({"kind": "summary", "file": arguments.filename, "errors": 1, "hidden": 0}), file=sys.stderr)
+        exit(1)
+    #print(compiled_program.program)
+
+    if (len(compiled_program.errors) != 0):
+        summary = compiled_program.program.diagnostics.summary()
+        if (arguments.error_format == 'json'):
+            hidden = compiled_program.program.diagnostics.hidden
+            print(json.dumps({"kind": "summary", "file": arguments.filename, "errors": len(compiled_program.errors) + hidden, "hidden": hidden}), file=sys.stderr)
+        elif (summary is not None):
+            print("\n" + summary, file=sys.stderr)
+        exit(1)
+
+    profiler = Profiler() if arguments.profile else None
+    result = compiled_program.run(output=StreamSink(sys.stdout, arguments.buffering), profiler=profiler, **run_options)
+    if (arguments.memo_stats):
+        for name, hits, misses in result.memo_stats:
+            print(f"memo <{name}()>: {hits} hits, {misses} misses", file=sys.stderr)
+    if (profiler is not None):
+        print(profiler.report(), file=sys.stderr)
+        if (arguments.profile_stacks is not None):
+            with open(arguments.profile_stacks, 'w') as f:
+                f.write(profiler.collapsedStacks())
+
+    exit(0)
+
+    # print("Program Complete")
+
+if __name__ == "__main__":
+    main()
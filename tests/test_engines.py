@@ -0,0 +1,240 @@
+# every engine and every optimization has to print exactly what the tree walker prints with all of them off.
+# run with python3 -m pytest tests
+import glob
+import itertools
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import litthewlang
+
+ENGINES = ["tree", "compiled", "python"]
+
+# one Interpreter per set of options so the grammar only gets built once for each, and every program only gets checked
+# once for each set of options (the engines and memo sizes all run the same checked program)
+interpreters = {}
+compiled_programs = {}
+
+def run(source, engine="tree", memo_size=1024, **options):
+    key = tuple(sorted(options.items()))
+    if key not in interpreters.keys():
+        interpreters[key] = litthewlang.Interpreter(**options)
+    if (source, key) not in compiled_programs.keys():
+        compiled_programs[(source, key)] = interpreters[key].compile(source)
+    compiled_program = compiled_programs[(source, key)]
+    if len(compiled_program.errors) != 0:
+        return "\n\n".join(compiled_program.errors)
+    return compiled_program.run(engine=engine, memo_size=memo_size, jobs=1).output
+
+LAZY_INLINED = """
+defo boom(m num x)
+m num returno = div(x, 0m)
+fino
+
+defo pick(m bool b, m num x, m num y)
+m num returno = lazyif(b, x, y)
+fino
+
+defo wrap(m num z)
+m num returno = pick(truo, z, boom(z))
+fino
+
+print(numtostr(pick(truo, 1m, boom(1m))))
+print(numtostr(wrap(2m)))
+"""
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("inline_size", [0, 1, 5, 20, 1000])
+def test_lazy_args_dont_depend_on_inlining(engine, inline_size):
+    expected = run(LAZY_INLINED, lazy_args=True, inline_size=0, fold=False)
+    assert expected == "1.0\n2.0\n"
+    assert run(LAZY_INLINED, engine, lazy_args=True, inline_size=inline_size) == expected
+
+META_INLINED = """
+defo where(m num x)
+m str returno = meta(x)
+fino
+print(where(1m))
+"""
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("fold", [True, False])
+def test_meta_in_an_inlined_function_points_at_the_function(engine, fold):
+    expected = run(META_INLINED, inline_size=0, fold=False)
+    assert expected.startswith("3: m str returno = meta(x)")
+    assert run(META_INLINED, engine, fold=fold) == expected
+
+# small programs that poke at the places where the engines and optimizations could disagree
+EDGE_CASES = {
+    "tail_recursion": """
+defo count(m num i, m num total)
+    m num returno = lazyif(lt(i, 3000m), count(add(i, 1m), add(total, i)), total)
+fino
+print(numtostr(count(0m, 0m)))
+""",
+    "mutual_recursion": """
+defo isEven(m num n)
+    m num returno = lazyif(eqnum(n, 0m), 1m, isOdd(sub(n, 1m)))
+fino
+defo isOdd(m num n)
+    m num returno = lazyif(eqnum(n, 0m), 0m, isEven(sub(n, 1m)))
+fino
+print(numtostr(isEven(500m)))
+print(numtostr(isOdd(77m)))
+""",
+    "memo": """
+defo fib(m num n)
+    m num returno = lazyif(lt(n, 2m), n, add(fib(sub(n, 1m)), fib(sub(n, 2m))))
+fino
+defo show(m num n)
+    m num returno = print(numtostr(n))
+fino
+m num g = 1m
+defo readsg(m num n)
+    m num returno = add(n, g)
+fino
+print(numtostr(fib(18m)))
+show(1m)
+show(1m)
+print(numtostr(readsg(1m)))
+g = 5m
+print(numtostr(readsg(1m)))
+""",
+    "globals": """
+m num g = 3m
+defo bump(m num k)
+    g = add(g, k)
+    m num returno = g
+fino
+print(numtostr(bump(2m)))
+print(numtostr(bump(0.5m)))
+print(numtostr(g))
+print(numtostr(print("side"m)))
+""",
+    "loops": """
+m num i = 0m
+m num total = 0m
+whilo lt(i, 10m)
+    total = add(total, i)
+    m num sq = mul(i, i)
+    i = add(i, 1m)
+fino
+print(numtostr(total))
+print(numtostr(sq))
+defo sumTo(m num n)
+    m num returno = 0m
+    m num k = 0m
+    whilo lt(k, n)
+        k = add(k, 1m)
+        m num j = 0m
+        whilo lt(j, k)
+            returno = add(returno, 1m)
+            j = add(j, 1m)
+        fino
+    fino
+fino
+print(numtostr(sumTo(30m)))
+m bool go = truo
+whilo go
+    go = falso
+    print("once"m)
+fino
+""",
+    "lazyif": """
+lazyif(truo, print("picked"m), print("not picked"m))
+defo f(m num n)
+    m num returno = lazyif(falso, print("never"m), add(n, add(1m, 1m)))
+fino
+print(numtostr(f(5m)))
+print(type(lazyif(truo, 1m, 2m)))
+""",
+    "heap": """
+fillnum(0m, 10m, 2.5m)
+addnum(3m, -7m)
+print(numtostr(sumnum(0m, 10m)))
+print(numtostr(minnum(0m, 10m)))
+print(numtostr(maxnum(0m, 10m)))
+muleachnum(0m, 10m, 2m)
+addeachnum(0m, 10m, 1m)
+diveachnum(0m, 10m, 4m)
+copynum(0m, 10m, 20m)
+copynum(20m, 10m, 22m)
+sortnum(20m, 12m)
+print(numtostr(getnum(20m)))
+print(numtostr(sumnum(20m, 12m)))
+print(numtostr(getnum(99m)))
+addstr(1m, "hello"m)
+print(getstr(1m))
+addbool(2m, truo)
+print(booltostr(getbool(2m)))
+""",
+    "ropes": """
+m str s = ""m
+defo build(m num i)
+    s = concat(s, numtostr(i))
+    lazyif(lt(i, 200m), build(add(i, 1m)), 0m)
+fino
+build(0m)
+print(s)
+print(booltostr(eqstr(s, concat(""m, s))))
+""",
+    "type_and_meta": """
+m num g = 1m
+print(type(g))
+print(meta(g))
+print(meta(add(1m, 2m)))
+defo where(m num x)
+    m str returno = meta(x)
+fino
+print(where(g))
+""",
+    "inlining": """
+defo inc(m num n)
+    m num returno = add(n, 1m)
+fino
+defo square(m num n)
+    m num returno = mul(n, n)
+fino
+defo show(m str label, m num n)
+    print(concat(label, numtostr(n)))
+fino
+defo both(m num n)
+    m num a = inc(n)
+    m num b = square(a)
+    show("squared "m, b)
+    m num returno = add(a, b)
+fino
+print(numtostr(both(3m)))
+print(numtostr(square(inc(square(2m)))))
+""",
+    "folding": """
+m num p = add(3m, 1m)
+print(numtostr(p))
+print(numtostr(add(p, mul(2m, 3m))))
+print(concat("a"m, concat("b"m, numtostr(sub(0m, 0m)))))
+print(booltostr(not(truo)))
+print(numtostr(mod(7m, 2m)))
+""",
+    "division_by_zero": """
+print(numtostr(div(1m, 3m)))
+print(numtostr(div(1m, 0m)))
+print("unreached"m)
+""",
+}
+
+PROGRAMS = {os.path.basename(path): open(path).read() for path in sorted(glob.glob(os.path.join(ROOT, "examples", "*.litthew")))}
+PROGRAMS.update(EDGE_CASES)
+
+# every engine with every optimization on and off (inline size 0 is inlining off, memo size None is memoizing off)
+COMBINATIONS = list(itertools.product(ENGINES, [True, False], [20, 0], [False, True], [1024, None]))
+
+@pytest.mark.parametrize("name", PROGRAMS.keys())
+@pytest.mark.parametrize("engine, fold, inline_size, lazy_args, memo_size", COMBINATIONS)
+def test_same_output_as_the_plain_tree_walker(name, engine, fold, inline_size, lazy_args, memo_size):
+    source = PROGRAMS[name]
+    expected = run(source, "tree", None, fold=False, inline_size=0, lazy_args=False)
+    assert run(source, engine, memo_size, fold=fold, inline_size=inline_size, lazy_args=lazy_args) == expected